@@ -0,0 +1,179 @@
+"""Archive finished jobs from Redis to local files.
+
+Completed and failed job hashes used to sit in Redis for ``job_meta_ttl``. With
+``archive_dir`` set, every job that finishes is also pushed onto its queue's
+archive list, and a background task moves them out in batches: each batch is
+appended to an hourly ``<archive_dir>/<queue>/<YYYYmmddHH>.ndjson.gz`` file as
+one gzip member, and indexed by job ID in ``<archive_dir>/index.sqlite`` (file,
+member offset, line). Job listings read jobs whose hash has expired back from
+the archive. If every API host sees the same directory (``archive_shared``),
+the job hash then gets the much shorter ``archived_job_ttl``; otherwise it
+keeps ``job_meta_ttl``, as hosts without the archive still need it.
+
+Files are append-only and every member is a complete gzip stream, so the files
+read with plain ``zcat``. Only the elected leader archives, and listings only
+find what is in the directory local to the API serving them.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+import zlib
+
+from starq.config import settings
+from starq.redis_client import archive_key, get_redis, job_meta_key, queue_set_key
+
+logger = logging.getLogger("starq")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    queue TEXT NOT NULL,
+    id TEXT NOT NULL,
+    file TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    line INTEGER NOT NULL,
+    PRIMARY KEY (queue, id)
+) WITHOUT ROWID
+"""
+
+
+def enabled() -> bool:
+    return bool(settings.archive_dir)
+
+
+def enqueue(pipe, name: str, job_ids: list[str]):
+    """Queue finished jobs for archiving (a no-op unless ``archive_dir`` is set)."""
+    if enabled() and job_ids:
+        pipe.rpush(archive_key(name), *job_ids)
+
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(settings.archive_dir, exist_ok=True)
+    db = sqlite3.connect(os.path.join(settings.archive_dir, "index.sqlite"), timeout=30)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute(_SCHEMA)
+    return db
+
+
+def _write(name: str, records: list[dict]):
+    """Append ``records`` to the current hour's file as one gzip member and index them."""
+    rel = os.path.join(name, time.strftime("%Y%m%d%H", time.gmtime()) + ".ndjson.gz")
+    path = os.path.join(settings.archive_dir, rel)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    data = "".join(json.dumps(rec, separators=(",", ":")) + "\n" for rec in records).encode()
+    with open(path, "ab") as f:
+        offset = f.tell()
+        f.write(gzip.compress(data))
+        f.flush()
+        os.fsync(f.fileno())
+
+    db = _connect()
+    try:
+        with db:
+            db.executemany(
+                "INSERT OR REPLACE INTO jobs (queue, id, file, offset, line) VALUES (?, ?, ?, ?, ?)",
+                [(name, rec["id"], rel, offset, line) for line, rec in enumerate(records)],
+            )
+    finally:
+        db.close()
+
+
+def _read_member(path: str, offset: int) -> list[bytes]:
+    """Lines of the gzip member starting at ``offset``."""
+    d = zlib.decompressobj(wbits=31)  # gzip framing; stops at the end of the member
+    out = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        while not d.eof:
+            chunk = f.read(65536)
+            if not chunk:
+                break
+            out.append(d.decompress(chunk))
+    return b"".join(out).splitlines()
+
+
+def _read(name: str, job_ids: list[str]) -> dict[str, dict]:
+    if not os.path.exists(os.path.join(settings.archive_dir, "index.sqlite")):
+        return {}
+    db = _connect()
+    try:
+        rows = db.execute(
+            f"SELECT id, file, offset, line FROM jobs WHERE queue = ? AND id IN ({','.join('?' * len(job_ids))})",
+            [name, *job_ids],
+        ).fetchall()
+    finally:
+        db.close()
+
+    members: dict[tuple[str, int], list[bytes]] = {}
+    found = {}
+    for job_id, rel, offset, line in rows:
+        if (rel, offset) not in members:
+            try:
+                members[rel, offset] = _read_member(os.path.join(settings.archive_dir, rel), offset)
+            except (OSError, zlib.error) as e:
+                logger.error(f"Could not read archive {rel}@{offset}: {e}")
+                members[rel, offset] = []
+        lines = members[rel, offset]
+        if line < len(lines):
+            found[job_id] = json.loads(lines[line])
+    return found
+
+
+async def lookup(name: str, job_ids: list[str]) -> dict[str, dict]:
+    """Archived job hashes by job ID, for jobs whose hash has left Redis."""
+    if not enabled() or not job_ids:
+        return {}
+    return await asyncio.to_thread(_read, name, job_ids)
+
+
+async def archive_queue(r, name: str) -> int:
+    """Move up to ``archive_batch_size`` finished jobs of one queue to the archive.
+
+    Returns how many were taken off the queue's archive list.
+    """
+    ak = archive_key(name)
+    job_ids = await r.lrange(ak, 0, settings.archive_batch_size - 1)
+    if not job_ids:
+        return 0
+    pipe = r.pipeline()
+    for job_id in job_ids:
+        pipe.hgetall(job_meta_key(name, job_id))
+    metas = await pipe.execute()
+
+    # A job can be queued twice (completed again after a retry); keep its latest state
+    records = {job_id: {**meta, "id": job_id, "queue": name} for job_id, meta in zip(job_ids, metas) if meta}
+    if records:
+        await asyncio.to_thread(_write, name, list(records.values()))
+
+    pipe = r.pipeline()
+    if settings.archive_shared:
+        for job_id in records:
+            pipe.expire(job_meta_key(name, job_id), settings.archived_job_ttl)
+    pipe.ltrim(ak, len(job_ids), -1)
+    await pipe.execute()
+    return len(job_ids)
+
+
+async def archive_jobs():
+    """Background task: archive finished jobs of every queue every ``archive_interval`` seconds."""
+    while True:
+        try:
+            await asyncio.sleep(settings.archive_interval)
+            r = get_redis()
+            try:
+                for name in await r.smembers(queue_set_key()):
+                    # Drain a backlog in batches before moving on
+                    while await archive_queue(r, name) >= settings.archive_batch_size:
+                        pass
+            finally:
+                await r.aclose()
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Archive error: {e}")
@@ -0,0 +1,434 @@
+"""starq-bench — load-test the API in process.
+
+Drives ``starq.main:app`` through httpx's ASGI transport, so the numbers cover
+routing, validation and every Redis round trip but no network or server
+overhead. Runs against an in-memory fakeredis server by default, or a real
+Redis with ``--redis-url`` (use a scratch database: the reclaim sweep walks
+every queue in it).
+
+Phases, each reported with throughput, p50/p99 request latency and Redis
+commands per job:
+
+    submit    N producers submitting batches
+    claim     M workers long-polling until every job is claimed
+    complete  M workers completing (or failing, see --fail-rate) what they claimed
+    list      paging through the queue's jobs
+    reclaim   one stale-job sweep over a queue of abandoned claims
+    depends   jobs submitted while their last parent completes
+    e2e       producers and workers running together (latency is submit-to-ack)
+
+``--json`` saves the results and ``--baseline`` compares against a saved run,
+exiting non-zero when Redis commands per job grow by more than ``--tolerance``.
+Command counts are deterministic enough to gate CI on; timings are shown for
+comparison only unless ``--max-slowdown`` is given.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import string
+import sys
+import time
+import uuid
+
+import httpx
+
+from starq import codec, redis_client
+from starq.config import settings
+from starq.deletion import purge_jobs
+from starq.main import app, sweep_stale_jobs
+from starq.metrics import REDIS_COMMANDS
+
+IDLE_AFTER_EMPTY = 0.01  # fakeredis answers blocking reads at once; back off instead of spinning
+RACE_STEPS = 40  # event loop turns a parent's completion is delayed by, at most, in the depends phase
+
+
+def _use_fake_redis():
+    try:
+        import fakeredis
+        from fakeredis.aioredis import FakeConnection
+    except ImportError:
+        sys.exit("The in-memory backend needs fakeredis: install starq[bench] or pass --redis-url")
+    import redis.asyncio as redis
+
+    settings.redis_cluster = False
+    redis_client.pool = redis.ConnectionPool(
+        connection_class=FakeConnection, server=fakeredis.FakeServer(), decode_responses=True
+    )
+
+
+def _redis_commands() -> float:
+    return sum(s.value for s in REDIS_COMMANDS.collect()[0].samples if s.name.endswith("_total"))
+
+
+def _percentile(values: list[float], pct: int) -> float:
+    if not values:
+        return 0.0
+    if len(values) == 1:
+        return values[0]
+    return statistics.quantiles(values, n=100, method="inclusive")[pct - 1]
+
+
+class Phase:
+    """Collects request latencies and the Redis commands issued while it is open."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.latencies: list[float] = []
+        self.jobs = 0
+        self.extra: dict[str, int] = {}
+
+    def __enter__(self):
+        self.commands = _redis_commands()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.commands = _redis_commands() - self.commands
+
+    async def timed(self, request):
+        start = time.perf_counter()
+        resp = await request
+        self.latencies.append(time.perf_counter() - start)
+        resp.raise_for_status()
+        return codec.decode(resp.content, resp.headers.get("content-type", codec.JSON))
+
+    def result(self) -> dict:
+        return {
+            "requests": len(self.latencies),
+            "jobs": self.jobs,
+            "jobs_per_s": round(self.jobs / self.seconds, 1) if self.seconds else 0.0,
+            "p50_ms": round(_percentile(self.latencies, 50) * 1000, 3),
+            "p99_ms": round(_percentile(self.latencies, 99) * 1000, 3),
+            "commands_per_job": round(self.commands / self.jobs, 2) if self.jobs else 0.0,
+            **self.extra,
+        }
+
+
+class Bench:
+    def __init__(self, client: httpx.AsyncClient, args):
+        self.client = client
+        self.args = args
+        self.payload_pad = "".join(random.choices(string.ascii_letters, k=args.payload_size))
+        self.deleted: list[str] = []
+
+    def _jobs(self, n: int, start: int) -> list[dict]:
+        return [{"payload": {"n": start + i, "data": self.payload_pad}} for i in range(n)]
+
+    async def create_queue(self, **options) -> str:
+        name = f"bench-{uuid.uuid4().hex[:8]}"
+        resp = await self.client.post("/api/v1/queues", json={"name": name, **options})
+        resp.raise_for_status()
+        return name
+
+    async def delete_queue(self, name: str):
+        resp = await self.client.delete(f"/api/v1/queues/{name}")
+        resp.raise_for_status()
+        self.deleted.append(name)
+
+    async def purge(self):
+        """Purge deleted queues, as the leader would (there is no lifespan, so no leader, here)."""
+        for name in self.deleted:
+            await purge_jobs(name)
+        self.deleted.clear()
+
+    async def produce(self, phase: Phase, queue: str, count: int, first: int, submitted: dict | None = None):
+        batch = self.args.batch
+        for start in range(first, first + count, batch):
+            n = min(batch, first + count - start)
+            sent_at = time.perf_counter()
+            body = await phase.timed(self.client.post(
+                f"/api/v1/queues/{queue}/jobs", json={"jobs": self._jobs(n, start)}
+            ))
+            phase.jobs += body["submitted"]
+            if submitted is not None:
+                for job_id in body.get("ids") or [job["id"] for job in body["jobs"]]:
+                    submitted[job_id] = sent_at
+
+    async def producers(self, phase: Phase, queue: str, total: int, submitted: dict | None = None):
+        n = self.args.producers
+        shares = [total // n + (1 if i < total % n else 0) for i in range(n)]
+        firsts = [sum(shares[:i]) for i in range(n)]
+        await asyncio.gather(*(
+            self.produce(phase, queue, share, first, submitted) for share, first in zip(shares, firsts)
+        ))
+
+    async def claim(self, phase: Phase, queue: str) -> list[str]:
+        start = time.perf_counter()
+        body = await phase.timed(self.client.post(
+            f"/api/v1/queues/{queue}/jobs/claim",
+            json={"count": self.args.claim_count, "block_ms": self.args.block_ms},
+        ))
+        ids = [job["id"] for job in body["jobs"]]
+        if not ids:
+            phase.extra["empty_claims"] = phase.extra.get("empty_claims", 0) + 1
+            if time.perf_counter() - start < self.args.block_ms / 1000:
+                await asyncio.sleep(IDLE_AFTER_EMPTY)
+        return ids
+
+    async def ack(self, phase: Phase, queue: str, job_id: str):
+        if random.random() < self.args.fail_rate:
+            request = self.client.put(f"/api/v1/queues/{queue}/jobs/{job_id}/fail", json={"error": "bench"})
+        else:
+            request = self.client.put(f"/api/v1/queues/{queue}/jobs/{job_id}/complete", json={"result": {"ok": True}})
+        await phase.timed(request)
+        phase.jobs += 1
+
+    async def submit(self, phase: Phase, queue: str, jobs: list[dict]) -> list[str]:
+        body = await phase.timed(self.client.post(f"/api/v1/queues/{queue}/jobs", json={"jobs": jobs}))
+        return body.get("ids") or [job["id"] for job in body["jobs"]]
+
+    async def finish(self, phase: Phase, queue: str, job_id: str):
+        await phase.timed(self.client.put(f"/api/v1/queues/{queue}/jobs/{job_id}/complete", json={"result": {}}))
+
+    async def claim_all(self, phase: Phase, queue: str, n: int) -> list[str]:
+        claimed: list[str] = []
+        while len(claimed) < n:
+            ids = await self.claim(phase, queue)
+            if not ids:
+                raise RuntimeError(f"{n - len(claimed)} jobs expected in '{queue}' are not claimable")
+            claimed.extend(ids)
+        return claimed
+
+    async def workers(self, worker):
+        await asyncio.gather(*(worker() for _ in range(self.args.workers)))
+
+    async def run(self) -> dict[str, dict]:
+        try:
+            return await self.run_phases()
+        finally:
+            await self.purge()
+
+    async def run_phases(self) -> dict[str, dict]:
+        args = self.args
+        results = {}
+        # max_retries=0 makes every fail terminal, so failed jobs leave the pending list
+        queue = await self.create_queue(max_retries=0, partitions=args.partitions)
+        try:
+            with Phase("submit") as phase:
+                await self.producers(phase, queue, args.jobs)
+            results["submit"] = phase.result()
+
+            claimed: list[str] = []
+            with Phase("claim") as phase:
+                async def claimer():
+                    while len(claimed) < args.jobs:
+                        ids = await self.claim(phase, queue)
+                        claimed.extend(ids)
+                        phase.jobs += len(ids)
+                await self.workers(claimer)
+            results["claim"] = phase.result()
+
+            with Phase("complete") as phase:
+                todo = iter(claimed)
+
+                async def acker():
+                    for job_id in todo:
+                        await self.ack(phase, queue, job_id)
+                await self.workers(acker)
+            results["complete"] = phase.result()
+
+            with Phase("list") as phase:
+                cursor = ""
+                while True:
+                    params = {"count": 100}
+                    if cursor:
+                        params["cursor"] = cursor
+                    body = await phase.timed(self.client.get(f"/api/v1/queues/{queue}/jobs", params=params))
+                    phase.jobs += len(body["jobs"])
+                    cursor = body["cursor"]
+                    if not body["has_more"]:
+                        break
+            results["list"] = phase.result()
+        finally:
+            await self.delete_queue(queue)
+
+        results["reclaim"] = await self.run_reclaim()
+        results["depends"] = await self.run_dependencies()
+        results["e2e"] = await self.run_e2e()
+        return results
+
+    async def run_reclaim(self) -> dict:
+        # The sweep looks at up to 100 pending entries per partition
+        total = min(self.args.jobs, 100)
+        queue = await self.create_queue()
+        try:
+            setup = Phase("setup")
+            await self.produce(setup, queue, total, 0)
+            while setup.jobs > 0:
+                setup.jobs -= len(await self.claim(setup, queue))
+            # Every claim is now stale
+            resp = await self.client.patch(f"/api/v1/queues/{queue}", json={"claim_timeout": 0})
+            resp.raise_for_status()
+
+            with Phase("reclaim") as phase:
+                start = time.perf_counter()
+                await sweep_stale_jobs(set())
+                phase.latencies.append(time.perf_counter() - start)
+                phase.jobs = total
+            return phase.result()
+        finally:
+            await self.delete_queue(queue)
+
+    async def run_dependencies(self) -> dict:
+        total = min(self.args.jobs, 200)
+        queue = await self.create_queue(max_retries=0)
+        try:
+            # Every child waits on two parents; the first is done and the
+            # second completes while the child is being submitted
+            setup = Phase("setup")
+            parents = []
+            for start in range(0, 2 * total, 100):
+                parents += await self.submit(setup, queue, self._jobs(min(100, 2 * total - start), start))
+            await self.claim_all(setup, queue, 2 * total)
+            pairs = list(zip(parents[::2], parents[1::2]))
+            for first, _ in pairs:
+                await self.finish(setup, queue, first)
+
+            with Phase("depends") as phase:
+                todo = iter(pairs)
+
+                async def complete_later(job_id: str, steps: int):
+                    for _ in range(steps):
+                        await asyncio.sleep(0)  # Land somewhere inside the submit
+                    await self.finish(phase, queue, job_id)
+
+                async def racer():
+                    for first, second in todo:
+                        await asyncio.gather(
+                            self.submit(phase, queue, [{"payload": {}, "depends_on": [first, second]}]),
+                            complete_later(second, random.randrange(RACE_STEPS)),
+                        )
+                        phase.jobs += 1
+                await self.workers(racer)
+            return phase.result()
+        finally:
+            await self.delete_queue(queue)
+
+    async def run_e2e(self) -> dict:
+        args = self.args
+        queue = await self.create_queue(max_retries=0, partitions=args.partitions)
+        submitted: dict[str, float] = {}
+        finished: dict[str, float] = {}
+        try:
+            with Phase("e2e") as phase:
+                producers = Phase("producers")
+                acks = Phase("acks")
+
+                async def worker():
+                    while len(finished) < args.jobs:
+                        for job_id in await self.claim(phase, queue):
+                            await self.ack(acks, queue, job_id)
+                            finished[job_id] = time.perf_counter()
+
+                await asyncio.gather(self.producers(producers, queue, args.jobs, submitted), self.workers(worker))
+                phase.jobs = len(finished)
+            phase.latencies = [finished[job_id] - submitted[job_id] for job_id in finished]
+            return phase.result()
+        finally:
+            await self.delete_queue(queue)
+
+
+def print_results(results: dict[str, dict], baseline: dict[str, dict] | None):
+    header = f"{'phase':10s} {'requests':>9s} {'jobs':>7s} {'jobs/s':>10s} {'p50 ms':>9s} {'p99 ms':>9s} {'cmds/job':>9s}"
+    print(header)
+    print("-" * len(header))
+    for name, res in results.items():
+        print(
+            f"{name:10s} {res['requests']:9d} {res['jobs']:7d} {res['jobs_per_s']:10.1f} "
+            f"{res['p50_ms']:9.2f} {res['p99_ms']:9.2f} {res['commands_per_job']:9.2f}"
+        )
+        base = (baseline or {}).get(name)
+        if base:
+            print(
+                f"{'  vs base':10s} {'':9s} {'':7s} {_delta(res['jobs_per_s'], base['jobs_per_s']):>10s} "
+                f"{_delta(res['p50_ms'], base['p50_ms']):>9s} {_delta(res['p99_ms'], base['p99_ms']):>9s} "
+                f"{_delta(res['commands_per_job'], base['commands_per_job']):>9s}"
+            )
+
+
+def _delta(new: float, old: float) -> str:
+    if not old:
+        return "-"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def regressions(results: dict[str, dict], baseline: dict[str, dict], tolerance: float, max_slowdown: float | None) -> list[str]:
+    found = []
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if res["commands_per_job"] > base["commands_per_job"] * (1 + tolerance):
+            found.append(f"{name}: {base['commands_per_job']} -> {res['commands_per_job']} Redis commands per job")
+        if max_slowdown is not None and res["jobs_per_s"] < base["jobs_per_s"] * (1 - max_slowdown):
+            found.append(f"{name}: {base['jobs_per_s']} -> {res['jobs_per_s']} jobs/s")
+    return found
+
+
+async def _main(args) -> dict[str, dict]:
+    if args.redis_url:
+        settings.redis_url = args.redis_url
+    else:
+        _use_fake_redis()
+
+    headers = {"Accept": codec.FORMATS[args.wire]}
+    if settings.api_keys:
+        headers["X-API-Key"] = settings.api_keys[0]
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers, timeout=None) as client:
+            return await Bench(client, args).run()
+    finally:
+        await redis_client.close_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="starq-bench", description="Benchmark the Starq API in process")
+    parser.add_argument("--redis-url", default=None, help="Benchmark against this Redis (default: in-memory fakeredis)")
+    parser.add_argument("-n", "--jobs", type=int, default=2000, help="Jobs per phase")
+    parser.add_argument("--producers", type=int, default=4, help="Concurrent producers")
+    parser.add_argument("--workers", type=int, default=8, help="Concurrent long-polling workers")
+    parser.add_argument("--batch", type=int, default=10, help="Jobs per submit request")
+    parser.add_argument("--claim-count", type=int, default=10, help="Jobs per claim request")
+    parser.add_argument("--block-ms", type=int, default=1000, help="Long-poll timeout for claims")
+    parser.add_argument("--partitions", type=int, default=1, help="Partitions of the benchmark queue")
+    parser.add_argument("--fail-rate", type=float, default=0.1, help="Fraction of jobs failed instead of completed")
+    parser.add_argument("--payload-size", type=int, default=64, help="Bytes of padding in each payload")
+    parser.add_argument("--wire", choices=list(codec.FORMATS), default="json", help="Response format to request")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for payloads and failures")
+    parser.add_argument("--json", default=None, help="Write results to this file")
+    parser.add_argument("--baseline", default=None, help="Compare against results saved with --json")
+    parser.add_argument("--tolerance", type=float, default=0.1, help="Allowed growth in Redis commands per job")
+    parser.add_argument("--max-slowdown", type=float, default=None, help="Also fail if jobs/s drops by more than this fraction")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    results = asyncio.run(_main(args))
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "results": results}, f, indent=2)
+
+    if baseline:
+        found = regressions(results, baseline, args.tolerance, args.max_slowdown)
+        if found:
+            print("\nRegressions:")
+            for line in found:
+                print(f"  {line}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
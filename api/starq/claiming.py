@@ -0,0 +1,141 @@
+"""Reading never-delivered entries from one or more streams for a claim."""
+
+from __future__ import annotations
+
+import itertools
+import random
+import time
+
+from starq import lifecycle
+from starq.config import settings
+from starq.metrics import CLAIM_BLOCK
+
+_rotation = itertools.count(random.randrange(1 << 16))
+
+
+def rotate(items: list) -> list:
+    """Start at a different element on each call so every stream gets drained."""
+    if len(items) < 2:
+        return items
+    i = next(_rotation) % len(items)
+    return items[i:] + items[:i]
+
+
+def _entries(results, index: dict[str, int]) -> list[tuple[int, str, dict]]:
+    return [
+        (index[stream], entry_id, fields)
+        for stream, messages in results or []
+        for entry_id, fields in messages
+    ]
+
+
+async def read_new(
+    r, streams: list[str], group: str, consumer: str, count: int, block_ms: int
+) -> tuple[list[tuple[int, str, dict]], float]:
+    """Deliver up to ``count`` new entries, preferring streams earlier in the list.
+
+    Returns ``(stream index, entry ID, fields)`` tuples and the seconds spent
+    blocked. One pipelined XINFO GROUPS finds the streams with undelivered
+    entries, which are read one at a time without blocking; only if all are
+    empty does it block, with a single XREADGROUP over every stream (or, in
+    cluster mode where the streams live in different slots, short blocking
+    reads on each in turn). Blocking reads are cut into ``drain_check_ms``
+    slices and give up once the server starts draining. Never returns more
+    than ``count``; any surplus is handed back (see ``_hand_back``).
+    """
+    index = {sk: i for i, sk in enumerate(streams)}
+    block = block_ms if block_ms > 0 else None
+    if len(streams) == 1:
+        if block is None:
+            results = await r.xreadgroup(group, consumer, {streams[0]: ">"}, count=count)
+            return _entries(results, index), 0.0
+        start = time.perf_counter()
+        results = await _read_blocking(r, group, consumer, {streams[0]: ">"}, count, block_ms)
+        return _entries(results, index), _blocked(start)
+
+    found: list[tuple[int, str, dict]] = []
+    for sk in await _backlogged(r, streams, group):
+        results = await r.xreadgroup(group, consumer, {sk: ">"}, count=count - len(found))
+        found.extend(_entries(results, index))
+        if len(found) >= count:
+            return found, 0.0
+    if found or block is None:
+        return found, 0.0
+
+    start = time.perf_counter()
+    if not settings.redis_cluster:
+        # A blocked read is woken by one stream, so count per stream keeps the
+        # total within `count`. If entries land between the sweep above and this
+        # call it returns at once from every non-empty stream, which can exceed
+        # `count` by up to one entry per stream when count < len(streams).
+        per_stream = max(1, count // len(streams))
+        results = await _read_blocking(r, group, consumer, {sk: ">" for sk in streams}, per_stream, block_ms)
+        found = _entries(results, index)
+        if len(found) > count:
+            await _hand_back(r, streams, group, consumer, found[count:])
+        return found[:count], _blocked(start)
+
+    deadline = time.monotonic() + block_ms / 1000
+    while not lifecycle.draining():
+        for sk in streams:
+            left_ms = int((deadline - time.monotonic()) * 1000)
+            if left_ms <= 0:
+                return [], _blocked(start)
+            results = await r.xreadgroup(
+                group, consumer, {sk: ">"}, count=count,
+                block=min(left_ms, settings.cluster_block_slice_ms),
+            )
+            if results:
+                return _entries(results, index), _blocked(start)
+    return [], _blocked(start)
+
+
+async def _backlogged(r, streams: list[str], group: str) -> list[str]:
+    """The streams whose group has entries left to deliver, in order.
+
+    ``lag`` is unknown (None, or missing before Redis 7) after entries were
+    deleted from the middle of a stream; such streams are kept.
+    """
+    pipe = r.pipeline()
+    for sk in streams:
+        pipe.xinfo_groups(sk)
+    backlogged = []
+    for sk, groups in zip(streams, await pipe.execute(raise_on_error=False)):
+        if isinstance(groups, Exception):
+            continue  # No stream
+        if any(g["name"] == group and g.get("lag") != 0 for g in groups):
+            backlogged.append(sk)
+    return backlogged
+
+
+async def _read_blocking(r, group: str, consumer: str, streams: dict[str, str], count: int, block_ms: int):
+    left_ms = block_ms
+    while left_ms > 0 and not lifecycle.draining():
+        slice_ms = min(left_ms, settings.drain_check_ms)
+        results = await r.xreadgroup(group, consumer, streams, count=count, block=slice_ms)
+        if results:
+            return results
+        left_ms -= slice_ms
+    return None
+
+
+async def _hand_back(r, streams: list[str], group: str, consumer: str, entries: list[tuple[int, str, dict]]) -> None:
+    """Leave delivered but unclaimed entries for the next claim to take over.
+
+    XCLAIM with TIME 0 makes them stale under any claim timeout, so the next
+    XAUTOCLAIM picks them up, and RETRYCOUNT 0 marks them as never handed
+    out: that claim doesn't count a retry and the reclaim sweep skips them.
+    """
+    by_stream: dict[int, list[str]] = {}
+    for i, entry_id, _ in entries:
+        by_stream.setdefault(i, []).append(entry_id)
+    pipe = r.pipeline()
+    for i, entry_ids in by_stream.items():
+        pipe.xclaim(streams[i], group, consumer, 0, entry_ids, time=0, retrycount=0, justid=True)
+    await pipe.execute()
+
+
+def _blocked(start: float) -> float:
+    seconds = time.perf_counter() - start
+    CLAIM_BLOCK.observe(seconds)
+    return seconds
@@ -3,26 +3,48 @@
 from __future__ import annotations
 
 import argparse
+import importlib
 import json
+import logging
+import os
 import sys
+import time
+from urllib.parse import urlencode
 from urllib.request import Request, urlopen
 from urllib.error import HTTPError
 
+from starq import codec
 
-def _request(url: str, method: str = "GET", data: dict | None = None, api_key: str | None = None) -> dict | list:
-    body = json.dumps(data).encode() if data else None
+
+def _request(
+    url: str,
+    method: str = "GET",
+    data: dict | None = None,
+    api_key: str | None = None,
+    media_type: str = codec.JSON,
+) -> dict | list:
+    body_type = codec.MSGPACK if media_type == codec.MSGPACK else codec.JSON
+    body = codec.encode(data, body_type) if data else None
     req = Request(url, data=body, method=method)
-    req.add_header("Content-Type", "application/json")
+    req.add_header("Content-Type", body_type)
+    req.add_header("Accept", media_type)
     if api_key:
         req.add_header("X-API-Key", api_key)
     try:
         with urlopen(req) as resp:
-            return json.loads(resp.read())
+            return codec.decode(resp.read(), resp.headers.get("Content-Type", codec.JSON))
     except HTTPError as e:
         print(f"Error: {e.code} {e.read().decode()}", file=sys.stderr)
         sys.exit(1)
 
 
+def _media_type(args) -> str:
+    if args.wire == "msgpack" and codec.msgpack is None:
+        print("--wire msgpack needs the msgpack package: install starq[msgpack]", file=sys.stderr)
+        sys.exit(1)
+    return codec.FORMATS[args.wire or "json"]
+
+
 def cmd_health(args):
     r = _request(f"{args.url}/api/health")
     print(json.dumps(r, indent=2))
@@ -34,18 +56,29 @@ def cmd_create(args):
         data["description"] = args.description
     if args.dedupe:
         data["dedupe"] = True
+    if args.partitions:
+        data["partitions"] = args.partitions
+    if args.partition_key:
+        data["partition_key"] = args.partition_key
     r = _request(f"{args.url}/api/v1/queues", method="POST", data=data, api_key=args.api_key)
     print(json.dumps(r, indent=2))
 
 
 def cmd_list(args):
-    r = _request(f"{args.url}/api/v1/queues")
-    queues = r.get("queues", [])
-    if not queues:
+    params = {"sort": args.sort}
+    if args.prefix:
+        params["prefix"] = args.prefix
+    shown = 0
+    while True:
+        r = _request(f"{args.url}/api/v1/queues?{urlencode(params)}")
+        for q in r.get("queues", []):
+            print(f"  {q['name']:20s}  pending={q.get('pending',0)}  completed={q.get('completed',0)}  failed={q.get('failed',0)}")
+            shown += 1
+        if not r.get("has_more"):
+            break
+        params["cursor"] = r["cursor"]
+    if not shown:
         print("No queues")
-        return
-    for q in queues:
-        print(f"  {q['name']:20s}  pending={q.get('pending',0)}  completed={q.get('completed',0)}  failed={q.get('failed',0)}")
 
 
 def cmd_info(args):
@@ -53,8 +86,29 @@ def cmd_info(args):
     print(json.dumps(r, indent=2))
 
 
+def cmd_update(args):
+    data = {}
+    if args.description is not None:
+        data["description"] = args.description
+    if args.max_retries is not None:
+        data["max_retries"] = args.max_retries
+    if args.claim_timeout is not None:
+        data["claim_timeout"] = args.claim_timeout
+    if args.dedupe is not None:
+        data["dedupe"] = args.dedupe
+    if not data:
+        print("Nothing to update", file=sys.stderr)
+        sys.exit(1)
+    r = _request(f"{args.url}/api/v1/queues/{args.name}", method="PATCH", data=data, api_key=args.api_key)
+    print(json.dumps(r, indent=2))
+
+
 def cmd_delete(args):
     r = _request(f"{args.url}/api/v1/queues/{args.name}", method="DELETE", api_key=args.api_key)
+    while args.wait and r.get("status") == "running":
+        print(f"  deleted {r.get('deleted', 0)}/{r.get('total', 0)} jobs")
+        time.sleep(1)
+        r = _request(f"{args.url}/api/v1/queues/{args.name}/deletion")
     print(json.dumps(r, indent=2))
 
 
@@ -87,7 +141,7 @@ def cmd_submit(args):
     for start in range(0, len(payloads), args.batch_size):
         batch = payloads[start : start + args.batch_size]
         body = {"jobs": [{"payload": p} for p in batch]}
-        result = _request(endpoint, method="POST", data=body, api_key=args.api_key)
+        result = _request(endpoint, method="POST", data=body, api_key=args.api_key, media_type=_media_type(args))
         total_submitted += result.get("submitted", len(result.get("jobs", [])))
         total_skipped += result.get("skipped", 0)
         print(f"  processed {total_submitted + total_skipped}/{len(payloads)}")
@@ -124,33 +178,77 @@ def cmd_jobs(args):
 
 def cmd_claim(args):
     data = {"count": args.count}
-    r = _request(f"{args.url}/api/v1/queues/{args.queue}/jobs/claim", method="POST", data=data, api_key=args.api_key)
+    queues = args.queue.split(",")
+    if len(queues) == 1:
+        url = f"{args.url}/api/v1/queues/{args.queue}/jobs/claim"
+    else:
+        url = f"{args.url}/api/v1/claim"
+        data["queues"] = queues
+    r = _request(url, method="POST", data=data, api_key=args.api_key, media_type=_media_type(args))
     jobs = r.get("jobs", [])
     if not jobs:
         print("No jobs to claim")
         return
     for j in jobs:
-        print(f"  claimed {j['id']}  payload={json.dumps(j.get('payload', {}))}")
+        queue = f"  queue={j['queue']}" if len(queues) > 1 else ""
+        print(f"  claimed {j['id']}{queue}  payload={json.dumps(j.get('payload', {}))}")
 
 
 def cmd_complete(args):
     data = {}
     if args.result:
         data["result"] = json.loads(args.result)
-    r = _request(f"{args.url}/api/v1/queues/{args.queue}/jobs/{args.job_id}/complete", method="PUT", data=data, api_key=args.api_key)
+    r = _request(
+        f"{args.url}/api/v1/queues/{args.queue}/jobs/{args.job_id}/complete",
+        method="PUT", data=data, api_key=args.api_key, media_type=_media_type(args),
+    )
     print(json.dumps(r, indent=2))
 
 
 def cmd_fail(args):
     data = {"error": args.error or ""}
-    r = _request(f"{args.url}/api/v1/queues/{args.queue}/jobs/{args.job_id}/fail", method="PUT", data=data, api_key=args.api_key)
+    r = _request(
+        f"{args.url}/api/v1/queues/{args.queue}/jobs/{args.job_id}/fail",
+        method="PUT", data=data, api_key=args.api_key, media_type=_media_type(args),
+    )
     print(json.dumps(r, indent=2))
 
 
+def cmd_work(args):
+    try:
+        from starq.worker import run
+    except ImportError:
+        print("The worker needs httpx: install starq[worker]", file=sys.stderr)
+        sys.exit(1)
+    module_name, _, func_name = args.handler.partition(":")
+    if not func_name:
+        print("Handler must be given as module:function", file=sys.stderr)
+        sys.exit(1)
+    sys.path.insert(0, os.getcwd())
+    handler = getattr(importlib.import_module(module_name), func_name)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    run(
+        handler,
+        args.queue.split(","),
+        url=args.url,
+        api_key=args.api_key,
+        concurrency=args.concurrency,
+        prefetch=args.prefetch,
+        processes=args.processes,
+        block_ms=args.block_ms,
+        wire=args.wire or "compact",
+    )
+
+
 def main():
     parser = argparse.ArgumentParser(prog="starq", description="Starq CLI — manage queues and jobs")
     parser.add_argument("-u", "--url", default="http://localhost:8000", help="API base URL")
     parser.add_argument("-k", "--api-key", default=None, help="API key for write operations")
+    parser.add_argument(
+        "--wire", choices=list(codec.FORMATS), default=None,
+        help="Encoding for submit/claim/complete/fail (default json) and workers (default compact)",
+    )
 
     sub = parser.add_subparsers(dest="command")
 
@@ -158,18 +256,30 @@ def main():
     sub.add_parser("health", help="Check API health")
 
     # queues
-    sub.add_parser("queues", help="List all queues")
+    p = sub.add_parser("queues", help="List all queues")
+    p.add_argument("-p", "--prefix", default="", help="Only queues whose name starts with this")
+    p.add_argument("--sort", choices=["name", "depth", "failed"], default="name", help="depth and failed list the highest first")
 
     p = sub.add_parser("create", help="Create a queue")
     p.add_argument("name", help="Queue name")
     p.add_argument("-d", "--description", default="", help="Queue description")
     p.add_argument("--dedupe", action="store_true", help="Reject jobs with duplicate payloads")
+    p.add_argument("-p", "--partitions", type=int, default=None, help="Spread the queue over N streams")
+    p.add_argument("--partition-key", default=None, help="Payload field that picks the partition")
 
     p = sub.add_parser("info", help="Queue details + stats")
     p.add_argument("name", help="Queue name")
 
+    p = sub.add_parser("update", help="Change queue settings")
+    p.add_argument("name", help="Queue name")
+    p.add_argument("-d", "--description", default=None, help="Queue description")
+    p.add_argument("--max-retries", type=int, default=None, help="Retries before dead-lettering")
+    p.add_argument("--claim-timeout", type=int, default=None, help="Seconds before a claimed job is reclaimed")
+    p.add_argument("--dedupe", action=argparse.BooleanOptionalAction, default=None, help="Reject jobs with duplicate payloads")
+
     p = sub.add_parser("delete", help="Delete a queue")
     p.add_argument("name", help="Queue name")
+    p.add_argument("-w", "--wait", action="store_true", help="Wait until all jobs are purged")
 
     # jobs
     p = sub.add_parser("submit", help="Submit JSONL file as jobs")
@@ -183,7 +293,7 @@ def main():
     p.add_argument("-l", "--limit", type=int, default=None, help="Max jobs to return")
 
     p = sub.add_parser("claim", help="Claim jobs from a queue")
-    p.add_argument("queue", help="Queue name")
+    p.add_argument("queue", help="Queue name (comma-separated to claim from several, in priority order)")
     p.add_argument("-n", "--count", type=int, default=1, help="Number of jobs to claim")
 
     p = sub.add_parser("complete", help="Mark a job as completed")
@@ -196,6 +306,14 @@ def main():
     p.add_argument("job_id", help="Job ID")
     p.add_argument("-e", "--error", default="", help="Error message")
 
+    p = sub.add_parser("work", help="Run a worker that processes jobs with a Python function")
+    p.add_argument("queue", help="Queue name (comma-separated to serve several, in priority order)")
+    p.add_argument("handler", help="Handler as module:function (e.g. tasks:resize)")
+    p.add_argument("-c", "--concurrency", type=int, default=4, help="Jobs processed at once")
+    p.add_argument("--prefetch", type=int, default=None, help="Jobs claimed ahead of the runners (default: concurrency)")
+    p.add_argument("--processes", action="store_true", help="Run a sync handler in a process pool")
+    p.add_argument("--block-ms", type=int, default=5000, help="Long-poll timeout for claims")
+
     args = parser.parse_args()
 
     if not args.command:
@@ -207,12 +325,14 @@ def main():
         "queues": cmd_list,
         "create": cmd_create,
         "info": cmd_info,
+        "update": cmd_update,
         "delete": cmd_delete,
         "submit": cmd_submit,
         "jobs": cmd_jobs,
         "claim": cmd_claim,
         "complete": cmd_complete,
         "fail": cmd_fail,
+        "work": cmd_work,
     }
     commands[args.command](args)
 
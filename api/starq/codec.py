@@ -0,0 +1,38 @@
+"""Wire format encoding shared by the server, the CLI and the worker SDK.
+
+Standard library only (plus the optional ``msgpack``), so clients can use it
+without loading the server stack. Negotiation lives in ``starq.wire``.
+"""
+
+from __future__ import annotations
+
+import json
+
+try:
+    import msgpack
+except ImportError:  # Optional: only needed for the msgpack format
+    msgpack = None
+
+JSON = "application/json"
+COMPACT_JSON = "application/vnd.starq.compact+json"
+MSGPACK = "application/msgpack"
+
+FORMATS = {"json": JSON, "compact": COMPACT_JSON, "msgpack": MSGPACK}
+
+
+def is_msgpack(media_type: str) -> bool:
+    return "msgpack" in media_type  # application/msgpack, application/x-msgpack, ...
+
+
+def encode(data, media_type: str) -> bytes:
+    if is_msgpack(media_type):
+        return msgpack.packb(data)
+    return json.dumps(data, separators=(",", ":")).encode()
+
+
+def decode(raw: bytes, media_type: str):
+    if not raw:
+        return {}
+    if is_msgpack(media_type):
+        return msgpack.unpackb(raw)
+    return json.loads(raw)
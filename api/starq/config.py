@@ -5,15 +5,39 @@ from pydantic_settings import BaseSettings
 
 class Settings(BaseSettings):
     redis_url: str = "redis://localhost:6379/0"
+    redis_cluster: bool = False  # treat redis_url as a Redis Cluster seed node
+    redis_replica_urls: str = ""  # comma-separated read replicas for list/get endpoints (non-cluster)
+    replica_max_lag: int = 5  # seconds a replica may trail its primary's replication offset before it is skipped
+    replica_check_interval: int = 5  # seconds between replica health checks
+    replica_timeout: float = 1  # seconds a replica may take to answer before reads fall back to the primary
     starq_api_keys: str = ""  # comma-separated for key rotation
     stale_job_interval: int = 30  # seconds between stale job sweeps
+    leader_lease_ms: int = 15000  # background tasks move to another process this long after the leader dies
     default_claim_timeout: int = 600  # 10 minutes
     default_max_retries: int = 3
     job_meta_ttl: int = 86400 * 7  # 7 days TTL on completed/failed job metadata
+    queue_config_ttl: int = 5  # seconds a cached queue config is trusted between invalidations
+    claim_max_streams: int = 256  # partition streams one multi-queue claim may span
+    cluster_block_slice_ms: int = 100  # cluster mode: per-stream block while long-polling several partitions
+    delete_batch_size: int = 500  # job keys unlinked per round trip when deleting a queue
+    deletion_status_ttl: int = 86400  # keep finished deletion progress around for a day
+    deletion_check_interval: int = 1  # seconds between the leader's checks for queue deletions to purge
+    warmup_connections: int = 10  # Redis connections opened at startup, before reporting ready
+    drain_check_ms: int = 1000  # long-polls check for shutdown this often
+    drain_timeout: int = 30  # seconds shutdown waits for in-flight requests
+    archive_dir: str = ""  # move finished jobs to hourly gzip NDJSON files here ("" = keep them in Redis)
+    archive_interval: int = 10  # seconds between archive passes
+    archive_batch_size: int = 500  # jobs written per archive batch
+    archive_shared: bool = False  # archive_dir is shared by every API host (only then may archived jobs leave Redis early)
+    archived_job_ttl: int = 3600  # TTL on job metadata once it is in a shared archive
 
     @property
     def api_keys(self) -> list[str]:
         return [k.strip() for k in self.starq_api_keys.split(",") if k.strip()]
 
+    @property
+    def replica_urls(self) -> list[str]:
+        return [u.strip() for u in self.redis_replica_urls.split(",") if u.strip()]
+
 
 settings = Settings()
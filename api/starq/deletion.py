@@ -0,0 +1,259 @@
+"""Background queue deletion.
+
+Deleting a queue used to SCAN the whole keyspace for its job keys inside the
+request. Instead, the request detaches the queue (renames its stream to a trash
+key and drops the small per-queue keys) and the leader's background task walks
+the trash stream of each partition — whose entries are exactly the queue's released jobs —
+and then its waiting and cancelled (never released) dependent jobs, unlinking
+job hashes in bounded batches. Progress is kept in ``deletion_key(name)`` so
+it can be polled and resumed after a restart.
+
+Until their cached config expires (``queue_config_ttl``), other replicas can
+still submit to the queue and recreate its stream. The purge keeps adopting
+such streams into the trash until that window has passed, and the queue can't
+be created again while it runs.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+import uuid
+
+from redis.exceptions import ResponseError
+
+from starq.config import settings
+from starq.models import QueueDeletion
+from starq.queue_config import partition_count, publish_change
+from starq.redis_client import (
+    archive_key,
+    cancelled_jobs_key,
+    children_key,
+    dedupe_key,
+    deletion_key,
+    deletion_set_key,
+    get_redis,
+    job_meta_key,
+    queue_meta_key,
+    stats_cancelled_key,
+    stats_completed_key,
+    stats_failed_key,
+    stream_job_id,
+    stream_key,
+    trash_stream_key,
+    trash_waiting_key,
+    waiting_key,
+)
+
+logger = logging.getLogger("starq")
+
+def deletion_from_status(name: str, status: dict) -> QueueDeletion:
+    return QueueDeletion(
+        queue=name,
+        status=status.get("status", "running"),
+        total=int(status.get("total", 0)),
+        deleted=int(status.get("deleted", 0)),
+        started_at=status.get("started_at", ""),
+        finished_at=status.get("finished_at", ""),
+    )
+
+
+async def start_deletion(r, name: str) -> QueueDeletion:
+    """Detach the queue so it disappears immediately and record the deletion for ``purge_deletions``.
+
+    The caller must already have removed ``name`` from the queue set.
+    """
+    delete_id = uuid.uuid4().hex[:12]
+    partitions = partition_count(await r.hgetall(queue_meta_key(name)))
+    total = 0
+    for p in range(partitions):
+        trash = trash_stream_key(name, delete_id, p)
+        try:
+            await r.rename(stream_key(name, p), trash)
+        except ResponseError:
+            continue  # No stream, nothing to purge
+        total += await r.xlen(trash)
+    waiting = trash_waiting_key(name, delete_id)
+    try:
+        await r.rename(waiting_key(name), waiting)
+    except ResponseError:
+        pass  # Nothing waiting
+    # Jobs failed by a dependency have no stream entry either: purge them with the waiting ones
+    pipe = r.pipeline()
+    pipe.zunionstore(waiting, [waiting, cancelled_jobs_key(name)])
+    pipe.unlink(cancelled_jobs_key(name))
+    total += (await pipe.execute())[0]
+
+    await r.unlink(
+        queue_meta_key(name),
+        stats_completed_key(name),
+        stats_failed_key(name),
+        stats_cancelled_key(name),
+        dedupe_key(name),
+        archive_key(name),
+    )
+
+    status = {
+        "status": "running",
+        "delete_id": delete_id,
+        "partitions": str(partitions),
+        "partition": "0",  # partition being purged
+        "cursor": "-",
+        "total": str(total),
+        "deleted": "0",
+        "started_at": str(int(time.time())),
+        "finished_at": "",
+    }
+    pipe = r.pipeline()
+    pipe.delete(deletion_key(name))
+    pipe.hset(deletion_key(name), mapping=status)
+    pipe.sadd(deletion_set_key(), name)
+    await pipe.execute()
+    await publish_change(r, name)
+    return deletion_from_status(name, status)
+
+
+async def deletion_in_progress(r, name: str) -> bool:
+    return await r.hget(deletion_key(name), "status") == "running"
+
+
+async def purge_jobs(name: str):
+    """Unlink a deleted queue's job hashes batch by batch, recording progress as we go."""
+    r = get_redis()
+    dk = deletion_key(name)
+    try:
+        status = await r.hgetall(dk)
+        delete_id = status.get("delete_id")
+        if status.get("status") != "running" or not delete_id:
+            await r.srem(deletion_set_key(), name)
+            return
+        cursor = status.get("cursor") or "-"
+        deleted = int(status.get("deleted", 0))
+        partition = int(status.get("partition", 0))
+        partitions = int(status.get("partitions", 1))
+        settled_at = int(status.get("started_at") or 0) + settings.queue_config_ttl
+
+        while True:
+            for p in range(partition, partitions):
+                trash = trash_stream_key(name, delete_id, p)
+                while True:
+                    entries = await r.xrange(trash, min=cursor, max="+", count=settings.delete_batch_size)
+                    if not entries:
+                        break
+                    job_ids = [stream_job_id(entry_id, p, fields) for entry_id, fields in entries]
+                    await r.unlink(*_job_keys(name, job_ids))
+                    deleted += len(entries)
+                    cursor = f"({entries[-1][0]}"
+                    await r.hset(dk, mapping={"cursor": cursor, "deleted": str(deleted)})
+
+                cursor = "-"
+                pipe = r.pipeline()
+                pipe.unlink(trash)
+                pipe.hset(dk, mapping={"partition": str(p + 1), "cursor": cursor})
+                await pipe.execute()
+
+            waiting = trash_waiting_key(name, delete_id)
+            while True:
+                job_ids = await r.zrange(waiting, 0, settings.delete_batch_size - 1)
+                if not job_ids:
+                    break
+                await r.unlink(*_job_keys(name, job_ids))
+                await r.zrem(waiting, *job_ids)
+                deleted += len(job_ids)
+                await r.hset(dk, "deleted", str(deleted))
+
+            adopted = await _adopt_orphans(r, name, delete_id, partitions)
+            if adopted is not None:
+                partition = adopted
+                continue
+            if time.time() >= settled_at:
+                break
+            await asyncio.sleep(min(1.0, settled_at - time.time()))
+
+        pipe = r.pipeline()
+        # Stale submits may have recreated these too
+        pipe.unlink(
+            stats_completed_key(name), stats_failed_key(name), stats_cancelled_key(name),
+            cancelled_jobs_key(name), dedupe_key(name),
+        )
+        pipe.hset(dk, mapping={"status": "done", "finished_at": str(int(time.time()))})
+        pipe.expire(dk, settings.deletion_status_ttl)
+        pipe.srem(deletion_set_key(), name)
+        await pipe.execute()
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        logger.error(f"Queue deletion error ({name}): {e}")
+    finally:
+        await r.aclose()
+
+
+async def _rename(r, src: str, dst: str) -> bool:
+    try:
+        await r.rename(src, dst)
+    except ResponseError:
+        return False  # No such key
+    return True
+
+
+async def _adopt_orphans(r, name: str, delete_id: str, partitions: int) -> int | None:
+    """Move streams and waiting jobs recreated since the queue was detached into the trash.
+
+    A replica whose cached config predates the deletion submits to the old keys
+    until its cache entry expires. Returns the first partition to purge again
+    (``partitions`` if only waiting jobs were found), or None.
+    """
+    adopted = []
+    added = 0
+    for p in range(partitions):
+        trash = trash_stream_key(name, delete_id, p)
+        # A trash stream still here was adopted just before an interrupted purge
+        if await r.exists(trash):
+            adopted.append(p)
+        elif await _rename(r, stream_key(name, p), trash):
+            adopted.append(p)
+            added += await r.xlen(trash)
+    waiting = trash_waiting_key(name, delete_id)
+    if await _rename(r, waiting_key(name), waiting):
+        adopted.append(partitions)
+        added += await r.zcard(waiting)
+    if not adopted:
+        return None
+
+    logger.warning(f"Queue '{name}' got {added} jobs after deletion started, purging them too")
+    pipe = r.pipeline()
+    pipe.hincrby(deletion_key(name), "total", added)
+    pipe.hset(deletion_key(name), mapping={"partition": str(min(adopted)), "cursor": "-"})
+    await pipe.execute()
+    return min(adopted)
+
+
+def _job_keys(name: str, job_ids: list[str]) -> list[str]:
+    """Each job's hash and the set of jobs waiting on it."""
+    return [key for job_id in job_ids for key in (job_meta_key(name, job_id), children_key(name, job_id))]
+
+
+async def purge_deletions():
+    """Leader task: purge every recorded queue deletion, one at a time.
+
+    Running purges here rather than in the process that took the DELETE means
+    each deletion has exactly one purge, including those resumed after a
+    restart, and a leader that loses its lease stops purging with its other
+    tasks.
+    """
+    while True:
+        try:
+            r = get_redis()
+            try:
+                names = await r.smembers(deletion_set_key())
+            finally:
+                await r.aclose()
+            for name in sorted(names):
+                await purge_jobs(name)
+            await asyncio.sleep(settings.deletion_check_interval)
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Queue deletion error: {e}")
+            await asyncio.sleep(settings.deletion_check_interval)
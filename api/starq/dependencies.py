@@ -0,0 +1,181 @@
+"""Job dependencies (``depends_on``).
+
+A job submitted with ``depends_on`` is held back as ``waiting``: it gets a job
+hash with ``deps_remaining`` set to its number of parents, but no stream entry,
+so no claim can see it. Each parent keeps a set of the jobs waiting on it
+(``children_key``). When a parent completes it pops that set and decrements
+each child's counter; the child that reaches zero is added to its partition's
+stream, with its job ID in the entry's ``job`` field, and from then on behaves
+like any other job. When a parent fails for good, its waiting children fail
+too, and theirs in turn; having no stream entry, they are listed from
+``cancelled_jobs_key``.
+
+Every parent/child edge is consumed exactly once: either by the parent popping
+its set (SPOP) or by the submit that found the parent already finished and took
+the child back out (SREM), never both. The parent's status is written before
+its set is popped, and a submit adds the child before reading that status, so
+one of the two always sees the other without a lock.
+"""
+
+from __future__ import annotations
+
+import time
+
+from starq import archive
+from starq.config import settings
+from starq.metrics import JOBS
+from starq.redis_client import (
+    cancelled_jobs_key,
+    children_key,
+    dedupe_key,
+    job_meta_key,
+    queue_rank_key,
+    split_job_id,
+    stats_cancelled_key,
+    stats_failed_key,
+    stream_key,
+    waiting_key,
+)
+
+_POP_ALL = 1 << 30  # SPOP count that empties any set
+
+FINISHED = ("completed", "failed")
+
+
+def pop_children(r, name: str, job_id: str):
+    """SPOP every job waiting on ``job_id``, on a client or queued on a pipeline.
+
+    The reply is the list of children. Call it after writing the job's final status.
+    """
+    return r.spop(children_key(name, job_id), _POP_ALL)
+
+
+async def unknown_jobs(r, name: str, job_ids) -> list[str]:
+    job_ids = list(job_ids)
+    pipe = r.pipeline()
+    for job_id in job_ids:
+        pipe.exists(job_meta_key(name, job_id))
+    found = await pipe.execute() if job_ids else []
+    return [job_id for job_id, exists in zip(job_ids, found) if not exists]
+
+
+async def register(r, name: str, edges: list[tuple[str, str]]) -> tuple[set[str], set[str]]:
+    """Attach already-stored waiting jobs to their parents, given ``(child, parent)`` edges.
+
+    Edges to parents that have already finished are settled here. Returns the
+    children released and failed as a result.
+    """
+    if not edges:
+        return set(), set()
+    pipe = r.pipeline()
+    for child, parent in edges:
+        pipe.sadd(children_key(name, parent), child)
+    for child, parent in edges:
+        pipe.hget(job_meta_key(name, parent), "status")
+    statuses = (await pipe.execute())[len(edges):]
+
+    # A parent that vanished (its hash expired) can no longer complete: fail the child
+    finished = [(edge, status) for edge, status in zip(edges, statuses) if status in FINISHED or status is None]
+    if not finished:
+        return set(), set()
+    pipe = r.pipeline()
+    for (child, parent), _ in finished:
+        pipe.srem(children_key(name, parent), child)
+    owned = [item for item, removed in zip(finished, await pipe.execute()) if removed]
+
+    released = await resolve(r, name, [child for (child, _), status in owned if status == "completed"])
+    failed = await cancel(r, name, [edge for edge, status in owned if status != "completed"])
+    return released, failed
+
+
+async def resolve(r, name: str, children: list[str]) -> set[str]:
+    """A parent of each of ``children`` completed: release those with no parents left."""
+    if not children:
+        return set()
+    pipe = r.pipeline()
+    for child in children:
+        pipe.hincrby(job_meta_key(name, child), "deps_remaining", -1)
+    ready = [child for child, left in zip(children, await pipe.execute()) if left == 0]
+    await release(r, name, ready)
+    return set(ready)
+
+
+async def release(r, name: str, children: list[str]):
+    """Add waiting jobs to their partition's stream, where workers can claim them."""
+    if not children:
+        return
+    pipe = r.pipeline()
+    for child in children:
+        pipe.hmget(job_meta_key(name, child), "payload", "priority")
+    fields = await pipe.execute()
+
+    # The status goes to pending before the entry exists, so a claim that picks
+    # the entry up straight away is not overwritten
+    pipe = r.pipeline()
+    for child, (payload, priority) in zip(children, fields):
+        _, partition = split_job_id(child)
+        pipe.hset(job_meta_key(name, child), "status", "pending")
+        pipe.xadd(stream_key(name, partition), {"payload": payload or "{}", "priority": priority or "0", "job": child})
+    entry_ids = (await pipe.execute())[1::2]
+
+    pipe = r.pipeline()
+    for child, entry_id in zip(children, entry_ids):
+        pipe.hset(job_meta_key(name, child), "entry", entry_id)
+    pipe.zrem(waiting_key(name), *children)
+    await pipe.execute()
+    JOBS.labels(name, "released").inc(len(children))
+
+
+async def cancel(r, name: str, edges: list[tuple[str, str]]) -> set[str]:
+    """Fail waiting jobs whose parent failed, given ``(child, parent)`` edges, and everything below them."""
+    failed: set[str] = set()
+    while edges:
+        pipe = r.pipeline()
+        for child, _ in edges:
+            jmk = job_meta_key(name, child)
+            pipe.hincrby(jmk, "failed_deps", 1)
+            pipe.hget(jmk, "dedupe_hash")
+        results = await pipe.execute()
+        # With several failed parents, only the first to get here fails the child
+        first = [
+            (child, parent, dh)
+            for (child, parent), n, dh in zip(edges, results[::2], results[1::2])
+            if n == 1
+        ]
+        if not first:
+            break
+
+        now_ms = time.time() * 1000
+        now = str(int(now_ms // 1000))
+        pipe = r.pipeline()
+        for child, parent, dh in first:
+            jmk = job_meta_key(name, child)
+            pipe.hset(jmk, mapping={
+                "status": "failed",
+                "error": f"dependency '{parent}' failed",
+                "completed_at": now,
+            })
+            pipe.expire(jmk, settings.job_meta_ttl)
+            if dh:
+                pipe.srem(dedupe_key(name), dh)
+        pipe.zrem(waiting_key(name), *[child for child, _, _ in first])
+        ck = cancelled_jobs_key(name)
+        pipe.zadd(ck, {child: now_ms for child, _, _ in first})
+        pipe.zremrangebyscore(ck, "-inf", now_ms - settings.job_meta_ttl * 1000)  # Hashes gone by now
+        pipe.incrby(stats_failed_key(name), len(first))
+        pipe.zadd(queue_rank_key("failed"), {name: len(first)}, xx=True, incr=True)
+        pipe.incrby(stats_cancelled_key(name), len(first))
+        archive.enqueue(pipe, name, [child for child, _, _ in first])
+        for child, _, _ in first:
+            pop_children(pipe, name, child)
+        grandchildren = (await pipe.execute())[-len(first):]
+
+        JOBS.labels(name, "cancelled").inc(len(first))
+        failed.update(child for child, _, _ in first)
+        edges = [(gc, child) for (child, _, _), gcs in zip(first, grandchildren) for gc in gcs or []]
+    return failed
+
+
+async def fail_children(r, name: str, job_id: str, children: list[str]) -> set[str]:
+    """Fail the ``children`` popped from a job that just failed for good."""
+    return await cancel(r, name, [(child, job_id) for child in children])
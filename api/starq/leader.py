@@ -0,0 +1,134 @@
+"""Leader election for background tasks.
+
+Every API process (``uvicorn --workers N``, and every replica) serves requests,
+but the reclaim sweep, the archiver and other maintenance must run once. The
+processes compete for ``leader_key()`` with ``SET NX PX``; the winner runs the
+background tasks and renews the lease every third of ``leader_lease_ms`` with
+a compare-and-PEXPIRE script, so it only ever extends its own lease. Renewals
+may only wait until a deadline a sixth of the lease before it runs out (timed
+from when the last successful renewal was sent); past that the tasks are
+stopped, so they never outlive the lease, and another process takes over
+within one lease. On shutdown the lease is released at once.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+
+from starq.config import settings
+from starq.redis_client import get_redis, leader_key
+
+logger = logging.getLogger("starq")
+
+IDENTITY = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Extend / drop the lease only while we still hold it
+_RENEW = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+_leading = False
+
+
+def is_leader() -> bool:
+    return _leading
+
+
+async def load_scripts(r):
+    """SCRIPT LOAD the lease scripts so the first renewal is a plain EVALSHA."""
+    for script in (_RENEW, _RELEASE):
+        await r.script_load(script)
+
+
+async def _acquire(r) -> bool:
+    return bool(await r.set(leader_key(), IDENTITY, nx=True, px=settings.leader_lease_ms))
+
+
+async def _renew(r) -> bool:
+    # register_script runs EVALSHA and falls back to loading the script if Redis lost it
+    return bool(await r.register_script(_RENEW)(keys=[leader_key()], args=[IDENTITY, settings.leader_lease_ms]))
+
+
+async def _release(r):
+    await r.register_script(_RELEASE)(keys=[leader_key()], args=[IDENTITY])
+
+
+async def _stop(tasks: list[asyncio.Task]):
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+
+
+async def lead(background):
+    """Background task: compete for leadership and run ``background`` tasks while leader.
+
+    ``background`` is a list of coroutine functions, started afresh on each
+    election and cancelled on losing the lease.
+    """
+    global _leading
+    lease = settings.leader_lease_ms / 1000
+    interval = lease / 3
+    margin = lease / 6
+    while True:
+        r = get_redis()
+        tasks: list[asyncio.Task] = []
+        try:
+            sent = time.monotonic()
+            if not await _acquire(r):
+                await asyncio.sleep(interval)
+                continue
+
+            _leading = True
+            deadline = sent + lease - margin
+            logger.info(f"Became leader ({IDENTITY})")
+            tasks = [asyncio.create_task(fn()) for fn in background]
+            while True:
+                await asyncio.sleep(max(0.0, min(interval, deadline - time.monotonic())))
+                sent = time.monotonic()
+                if sent >= deadline:
+                    logger.warning("Could not renew the leader lease in time; stopping background tasks")
+                    break
+                try:
+                    if not await asyncio.wait_for(_renew(r), deadline - sent):
+                        logger.warning("Lost the leader lease to another process")
+                        break
+                    deadline = sent + lease - margin
+                except asyncio.TimeoutError:
+                    logger.warning("Leader lease renewal did not answer in time; stopping background tasks")
+                    break
+                except Exception as e:
+                    logger.error(f"Leader lease renewal error: {e}")
+        except asyncio.CancelledError:
+            if _leading:
+                await _stop(tasks)
+                tasks = []
+                try:
+                    await _release(r)
+                except Exception as e:
+                    logger.error(f"Could not release the leader lease: {e}")
+            raise
+        except Exception as e:
+            logger.error(f"Leader election error: {e}")
+            await asyncio.sleep(interval)
+        finally:
+            await _stop(tasks)
+            _leading = False
+            await r.aclose()
@@ -0,0 +1,125 @@
+"""Startup warmup and graceful shutdown.
+
+On startup the Redis pool is filled, Lua scripts are loaded and the queue
+config cache is filled before the API reports ready on ``/api/ready``, so the
+first requests after a restart don't pay for setup. If that fails, the
+readiness probe retries it without the configs, which would have expired by
+the time traffic arrives anyway. On SIGTERM the API starts draining at once, before
+the server stops accepting connections: readiness turns 503 so load balancers
+move traffic away, new claims return no jobs, long-polls give up at their next
+check (every ``drain_check_ms``), responses ask clients to reconnect elsewhere,
+and shutdown waits for in-flight requests (acks included) before the pool is
+closed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import signal
+
+from starq import leader
+from starq.config import settings
+from starq import queue_config
+from starq.redis_client import get_redis, queue_set_key, warm_pool
+
+logger = logging.getLogger("starq")
+
+_ready = False
+_draining = False
+_inflight = 0
+_idle: asyncio.Event | None = None  # set while no request is in flight
+
+
+def ready() -> bool:
+    return _ready and not _draining
+
+
+def draining() -> bool:
+    return _draining
+
+
+def start_draining():
+    global _draining
+    if not _draining:
+        logger.info(f"Draining: {_inflight} requests in flight")
+    _draining = True
+
+
+async def warm_up(configs: bool = True):
+    """Open pool connections, load scripts and (with ``configs``) every queue's config, then report ready."""
+    global _ready, _draining
+    _draining = False  # An app can be started again after a shutdown (e.g. under a test client)
+
+    await warm_pool(settings.warmup_connections)
+
+    r = get_redis()
+    try:
+        await leader.load_scripts(r)
+        names = await r.smembers(queue_set_key())
+    finally:
+        await r.aclose()
+    if configs:
+        await queue_config.preload(list(names))
+
+    _ready = True
+    loaded = f"{len(names)} queue configs" if configs else "no queue configs"
+    logger.info(f"Warmed up: {settings.warmup_connections} connections, {loaded}")
+
+
+def drain_on_sigterm():
+    """Start draining as soon as SIGTERM arrives, then let the server's own handler run.
+
+    Must be called after the server installed its handlers (i.e. from lifespan startup).
+    """
+    loop = asyncio.get_running_loop()
+    previous = signal.getsignal(signal.SIGTERM)
+
+    def handler(signum, frame):
+        loop.call_soon_threadsafe(start_draining)
+        if callable(previous):
+            previous(signum, frame)
+
+    try:
+        signal.signal(signal.SIGTERM, handler)
+    except ValueError:
+        pass  # Not the main thread (e.g. under a test client)
+
+
+async def wait_idle():
+    """Wait up to ``drain_timeout`` seconds for in-flight requests to finish."""
+    if _idle is None or _idle.is_set():
+        return
+    try:
+        await asyncio.wait_for(_idle.wait(), settings.drain_timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Shutting down with {_inflight} requests still in flight")
+
+
+class InflightMiddleware:
+    """ASGI middleware counting in-flight requests; while draining, responses close the connection."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        global _inflight, _idle
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_closing(message):
+            if _draining and message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (b"connection", b"close")]
+            await send(message)
+
+        if _idle is None:
+            _idle = asyncio.Event()
+        _inflight += 1
+        _idle.clear()
+        try:
+            await self.app(scope, receive, send_closing)
+        finally:
+            _inflight -= 1
+            if not _inflight:
+                _idle.set()
@@ -6,41 +6,67 @@ import logging
 import time
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 
+from starq import archive, dependencies, leader, lifecycle
 from starq.config import settings
+from starq.deletion import purge_deletions
+from starq.metrics import (
+    JOBS,
+    MULTIPROCESS,
+    QUEUE_JOBS,
+    RECLAIM_SWEEP,
+    MetricsMiddleware,
+    forget_queue,
+    process_exited,
+    render,
+)
 from starq.redis_client import (
+    archive_key,
     close_pool,
     consumer_group,
     dedupe_key,
     get_redis,
     job_meta_key,
-    queue_meta_key,
+    queue_rank_key,
     queue_set_key,
+    record_pool_size,
     stats_failed_key,
+    stream_job_id,
     stream_key,
 )
-from starq.routers import jobs, queues
+from starq.queue_config import get_queue_config, partition_count, watch_config_changes
+from starq.routers import claims, jobs, queues
+from starq.routers.queues import index_queues, queue_info
 
 logger = logging.getLogger("starq")
 
 
-async def reclaim_stale_jobs():
-    """Background task: reclaim stale jobs or dead-letter them."""
-    while True:
-        try:
-            await asyncio.sleep(settings.stale_job_interval)
-            r = get_redis()
-            names = await r.smembers(queue_set_key())
+async def sweep_stale_jobs(tracked: set[str]) -> set[str]:
+    """One reclaim pass: requeue or dead-letter stale jobs and refresh the depth gauges.
+
+    ``tracked`` is the set of queues seen by the previous sweep; the queues seen
+    by this one are returned.
+    """
+    started = time.perf_counter()
+    r = get_redis()
+    try:
+        names = await r.smembers(queue_set_key())
+
+        for name in tracked - names:
+            forget_queue(name)
+        tracked = set(names)
 
-            for name in names:
-                meta = await r.hgetall(queue_meta_key(name))
-                claim_timeout_ms = int(meta.get("claim_timeout", 600)) * 1000
-                max_retries = int(meta.get("max_retries", 3))
-                sk = stream_key(name)
-                cg = consumer_group(name)
+        for name in names:
+            meta = await get_queue_config(name)
+            claim_timeout_ms = int(meta.get("claim_timeout", 600)) * 1000
+            max_retries = int(meta.get("max_retries", 3))
+            cg = consumer_group(name)
 
+            for p in range(partition_count(meta)):
+                sk = stream_key(name, p)
                 try:
                     pending = await r.xpending_range(sk, cg, min="-", max="+", count=100)
                 except Exception:
@@ -49,11 +75,14 @@ async def reclaim_stale_jobs():
                 now_ms = int(time.time() * 1000)
                 for entry in pending:
                     idle = entry.get("time_since_delivered", 0)
-                    if idle < claim_timeout_ms:
-                        continue
+                    if idle < claim_timeout_ms or entry.get("times_delivered") == 0:
+                        continue  # Still held, or handed back unread by a claim
 
                     entry_id = entry.get("message_id", "")
-                    jmk = job_meta_key(name, entry_id)
+                    # Released dependent jobs name their job ID in the entry
+                    found = await r.xrange(sk, min=entry_id, max=entry_id)
+                    job_id = stream_job_id(entry_id, p, found[0][1] if found else None)
+                    jmk = job_meta_key(name, job_id)
                     retries = int(await r.hget(jmk, "retries") or 0)
 
                     if retries >= max_retries:
@@ -66,33 +95,92 @@ async def reclaim_stale_jobs():
                         })
                         await r.xack(sk, cg, entry_id)
                         await r.incr(stats_failed_key(name))
+                        await r.zadd(queue_rank_key("failed"), {name: 1}, xx=True, incr=True)
                         if dh:
                             await r.srem(dedupe_key(name), dh)
+                        if archive.enabled():
+                            await r.rpush(archive_key(name), job_id)
+                        children = await dependencies.pop_children(r, name, job_id)
+                        await dependencies.fail_children(r, name, job_id, children or [])
+                        JOBS.labels(name, "dead_lettered").inc()
                     else:
                         # Reset for reclaim
                         await r.hset(jmk, mapping={
                             "status": "pending",
                             "claimed_at": "",
                         })
+                        JOBS.labels(name, "requeued").inc()
+
+            info = await queue_info(r, name)
+            QUEUE_JOBS.labels(name, "pending").set(info.pending)
+            QUEUE_JOBS.labels(name, "claimed").set(info.claimed)
+            QUEUE_JOBS.labels(name, "waiting").set(info.waiting)
+            await r.zadd(queue_rank_key("depth"), {name: info.pending}, xx=True)
+    finally:
+        await r.aclose()
+    RECLAIM_SWEEP.observe(time.perf_counter() - started)
+    return tracked
+
 
-            await r.aclose()
+async def reclaim_stale_jobs():
+    """Background task: run ``sweep_stale_jobs`` every ``stale_job_interval`` seconds."""
+    tracked: set[str] = set()
+    while True:
+        try:
+            await asyncio.sleep(settings.stale_job_interval)
+            tracked = await sweep_stale_jobs(tracked)
         except asyncio.CancelledError:
             break
         except Exception as e:
             logger.error(f"Stale job reclaim error: {e}")
 
 
+async def take_over():
+    """Leader task, run once per election: reconcile state a previous leader may have left behind."""
+    try:
+        await index_queues()
+    except Exception as e:
+        logger.error(f"Could not index queues: {e}")
+
+
+async def record_pool_metrics():
+    """Background task (multiprocess metrics only): refresh this process's pool gauges."""
+    while True:
+        record_pool_size()
+        await asyncio.sleep(5)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     logger.info("Starting Starq API...")
-    task = asyncio.create_task(reclaim_stale_jobs())
-    yield
-    task.cancel()
     try:
-        await task
-    except asyncio.CancelledError:
-        pass
+        await lifecycle.warm_up()
+    except Exception as e:
+        logger.error(f"Warmup failed, /api/ready will retry: {e}")
+    lifecycle.drain_on_sigterm()
+
+    # Every process serves requests and watches config; only the leader runs the rest
+    background = [take_over, reclaim_stale_jobs, purge_deletions]
+    if archive.enabled():
+        background.append(archive.archive_jobs)
+    tasks = [
+        asyncio.create_task(watch_config_changes()),
+        asyncio.create_task(leader.lead(background)),
+    ]
+    if MULTIPROCESS:
+        tasks.append(asyncio.create_task(record_pool_metrics()))
+    yield
+    lifecycle.start_draining()
+    for task in tasks:
+        task.cancel()
+    for task in tasks:
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    await lifecycle.wait_idle()
     await close_pool()
+    process_exited()
     logger.info("Starq API shut down.")
 
 
@@ -113,8 +201,32 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(lifecycle.InflightMiddleware)
+
 app.include_router(queues.router, prefix="/api/v1")
 app.include_router(jobs.router, prefix="/api/v1")
+app.include_router(claims.router, prefix="/api/v1")
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.get("/api/ready")
+async def ready():
+    """Readiness, unlike health: 503 until warmed up and again once draining for shutdown."""
+    if not lifecycle.ready() and not lifecycle.draining():
+        try:
+            # Startup warmup failed; retry it without loading every queue's config per probe
+            await lifecycle.warm_up(configs=False)
+        except Exception as e:
+            return JSONResponse({"status": "starting", "detail": str(e)}, status_code=503)
+    if lifecycle.draining():
+        return JSONResponse({"status": "draining"}, status_code=503)
+    return {"status": "ready"}
 
 
 @app.get("/api/health")
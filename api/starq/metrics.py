@@ -0,0 +1,166 @@
+"""Prometheus metrics for the API, its Redis calls and the background sweeps.
+
+With several worker processes, set ``PROMETHEUS_MULTIPROC_DIR`` to an empty
+directory: each process then writes its samples there and ``/metrics`` serves
+the aggregate, whichever process answers the scrape.
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+MULTIPROCESS = bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+REQUEST_LATENCY = Histogram(
+    "starq_http_request_duration_seconds",
+    "HTTP request latency by route template",
+    ["route", "method", "status"],
+)
+REDIS_LATENCY = Histogram(
+    "starq_redis_command_duration_seconds",
+    "Redis round-trip latency by command (pipelines are timed as PIPELINE)",
+    ["command"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+REDIS_COMMANDS = Counter(
+    "starq_redis_commands_total",
+    "Redis commands sent, including those inside pipelines",
+    ["command"],
+)
+REDIS_POOL = Gauge(
+    "starq_redis_pool_connections",
+    "Connections in the primary Redis pool",
+    ["state"],
+    multiprocess_mode="livesum",  # summed over live worker processes
+)
+
+CLAIM_BLOCK = Histogram(
+    "starq_claim_block_seconds",
+    "Time a claim spent blocked in XREADGROUP waiting for new jobs",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+CLAIM_WORK = Histogram(
+    "starq_claim_work_seconds",
+    "Time a claim spent doing everything except blocking",
+)
+JOBS = Counter(
+    "starq_jobs_total",
+    "Job state transitions",
+    ["queue", "event"],  # submitted | claimed | completed | retried | failed | requeued | dead_lettered | released | cancelled
+)
+
+QUEUE_JOBS = Gauge(
+    "starq_queue_jobs",
+    "Jobs per queue and state, refreshed by the reclaim sweep",
+    ["queue", "state"],  # pending | claimed | waiting
+    multiprocess_mode="livemostrecent",  # only the leader's sweep sets it
+)
+RECLAIM_SWEEP = Histogram(
+    "starq_reclaim_sweep_seconds",
+    "Duration of one stale-job reclaim sweep over all queues",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+
+def observe_redis(command: str, seconds: float, count: int = 1):
+    REDIS_LATENCY.labels(command).observe(seconds)
+    if command != "PIPELINE":
+        REDIS_COMMANDS.labels(command).inc(count)
+
+
+def instrument_pipeline(pipe):
+    """Time ``pipe.execute()`` and count the commands queued on it."""
+    queued: list[str] = []
+    queue_command = pipe.execute_command
+    execute = pipe.execute
+
+    def execute_command(*args, **kwargs):
+        queued.append(str(args[0]).upper())
+        return queue_command(*args, **kwargs)
+
+    async def timed_execute(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await execute(*args, **kwargs)
+        finally:
+            observe_redis("PIPELINE", time.perf_counter() - start)
+            for command in queued:
+                REDIS_COMMANDS.labels(command).inc()
+            queued.clear()
+
+    pipe.execute_command = execute_command
+    pipe.execute = timed_execute
+    return pipe
+
+
+def forget_queue(name: str):
+    """Drop gauges for a queue that no longer exists."""
+    for state in ("pending", "claimed", "waiting"):
+        try:
+            QUEUE_JOBS.remove(name, state)
+        except KeyError:
+            pass
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording request latency labelled with the matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            REQUEST_LATENCY.labels(_route_label(scope), scope["method"], str(status)).observe(
+                time.perf_counter() - start
+            )
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is None:
+        return "unmatched"
+    # Routes included with a prefix may report their path relative to it;
+    # the prefix has no parameters, so take it from the request path.
+    path = scope["path"]
+    prefix = path.split("/")[: path.count("/") - route.path.count("/") + 1]
+    return "/".join(prefix) + route.path
+
+
+def render() -> tuple[bytes, str]:
+    if not MULTIPROCESS:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def process_exited():
+    """Drop this process's live gauges from the multiprocess aggregate."""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,238 @@
+"""starq-migrate — move data written by older releases to the hash-tagged key layout.
+
+Older releases stored each queue under untagged keys (``starq:stream:{name}``,
+``starq:job:{queue}:{id}``, ...) with one consumer group per queue. The current
+layout keeps each queue's keys in one cluster slot and uses a single consumer
+group name on every stream. Stop the API before running this.
+
+Without ``--target`` keys are renamed in place. With ``--target`` (for example a
+new Redis Cluster) they are copied with DUMP/RESTORE, keeping their TTLs.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+
+import redis
+from redis.cluster import RedisCluster
+
+from starq.config import settings
+from starq.redis_client import (
+    consumer_group,
+    dedupe_key,
+    job_meta_key,
+    queue_meta_key,
+    queue_set_key,
+    stats_completed_key,
+    stats_failed_key,
+    stream_key,
+)
+
+BATCH = 500
+CONSUMER = "w"  # consumer name the API claims with
+
+
+# --- Legacy key layout ---
+
+def legacy_queue_meta_key(name: str) -> str:
+    return f"starq:queue:{name}"
+
+
+def legacy_stream_key(name: str) -> str:
+    return f"starq:stream:{name}"
+
+
+def legacy_consumer_group(name: str) -> str:
+    return name
+
+
+def legacy_job_meta_key(queue: str, job_id: str) -> str:
+    return f"starq:job:{queue}:{job_id}"
+
+
+def legacy_stats_completed_key(name: str) -> str:
+    return f"starq:stats:{name}:completed"
+
+
+def legacy_stats_failed_key(name: str) -> str:
+    return f"starq:stats:{name}:failed"
+
+
+def legacy_dedupe_key(name: str) -> str:
+    return f"starq:dedupe:{name}"
+
+
+# --- Migration ---
+
+
+class Mover:
+    """Moves keys to the new layout: RENAME on the same server, DUMP/RESTORE to another one."""
+
+    def __init__(self, source_url: str, target_url: str | None, target_cluster: bool, delete_source: bool):
+        self.src = redis.Redis.from_url(source_url, decode_responses=True)
+        self.src_raw = redis.Redis.from_url(source_url)  # DUMP payloads are binary
+        if target_url is None:
+            self.dst = self.src
+        elif target_cluster:
+            self.dst = RedisCluster.from_url(target_url, decode_responses=True)
+        else:
+            self.dst = redis.Redis.from_url(target_url, decode_responses=True)
+        self.same_server = target_url is None
+        self.delete_source = delete_source
+
+    def move(self, pairs: list[tuple[str, str]]) -> int:
+        """Move ``(old_key, new_key)`` pairs in one round trip per step. Returns how many existed."""
+        if not pairs:
+            return 0
+        if self.same_server:
+            pipe = self.src.pipeline(transaction=False)
+            for old_key, new_key in pairs:
+                pipe.rename(old_key, new_key)
+            # RENAME fails for keys that are gone (e.g. expired job metadata)
+            results = pipe.execute(raise_on_error=False)
+            return sum(1 for res in results if not isinstance(res, Exception))
+
+        pipe = self.src_raw.pipeline(transaction=False)
+        for old_key, _ in pairs:
+            pipe.dump(old_key)
+            pipe.pttl(old_key)
+        results = pipe.execute()
+
+        pipe = self.dst.pipeline(transaction=False)
+        found = []
+        for (old_key, new_key), data, ttl in zip(pairs, results[::2], results[1::2]):
+            if data is not None:
+                pipe.restore(new_key, max(ttl, 0), data, replace=True)
+                found.append(old_key)
+        pipe.execute()
+        if self.delete_source and found:
+            self.src.delete(*found)
+        return len(found)
+
+
+def _id_before(entry_id: str) -> str:
+    ts, seq = (int(p) for p in entry_id.split("-"))
+    if seq > 0:
+        return f"{ts}-{seq - 1}"
+    return f"{ts - 1}-{2**64 - 1}"
+
+
+def convert_group(r, sk: str, old_group: str, new_group: str):
+    """Replace ``old_group`` on ``sk`` with ``new_group``, keeping its read position and pending entries.
+
+    A group's pending list can't be copied directly, so the new group starts
+    just before the oldest pending entry, re-reads everything up to the old
+    group's last-delivered ID and acknowledges whatever the old group had
+    already acknowledged.
+    """
+    groups = {g["name"]: g for g in r.xinfo_groups(sk)}
+    if old_group not in groups or new_group in groups:
+        return
+    last_delivered = groups[old_group]["last-delivered-id"]
+
+    pending_ids: set[str] = set()
+    start = "-"
+    while True:
+        batch = r.xpending_range(sk, old_group, min=start, max="+", count=BATCH)
+        if not batch:
+            break
+        pending_ids.update(e["message_id"] for e in batch)
+        start = f"({batch[-1]['message_id']}"
+
+    if not pending_ids:
+        r.xgroup_create(sk, new_group, id=last_delivered)
+    else:
+        first = min(pending_ids, key=lambda i: tuple(int(p) for p in i.split("-")))
+        r.xgroup_create(sk, new_group, id=_id_before(first))
+
+        # Count entries up to last_delivered so the re-read stops exactly there
+        remaining = 0
+        start = first
+        while True:
+            batch = r.xrange(sk, min=start, max=last_delivered, count=BATCH)
+            if not batch:
+                break
+            remaining += len(batch)
+            start = f"({batch[-1][0]}"
+
+        while remaining > 0:
+            results = r.xreadgroup(new_group, CONSUMER, {sk: ">"}, count=min(remaining, BATCH))
+            entries = results[0][1] if results else []
+            if not entries:
+                break
+            remaining -= len(entries)
+            acked = [entry_id for entry_id, _ in entries if entry_id not in pending_ids]
+            if acked:
+                r.xack(sk, new_group, *acked)
+
+    r.xgroup_destroy(sk, old_group)
+
+
+def migrate_queue(m: Mover, name: str, dry_run: bool) -> int:
+    """Move one queue. Returns the number of job hashes moved."""
+    old_sk = legacy_stream_key(name)
+    moved = 0
+    start = "-"
+    while True:
+        entries = m.src.xrange(old_sk, min=start, max="+", count=BATCH)
+        if not entries:
+            break
+        start = f"({entries[-1][0]}"
+        if dry_run:
+            moved += m.src.exists(*[legacy_job_meta_key(name, entry_id) for entry_id, _ in entries])
+        else:
+            moved += m.move([
+                (legacy_job_meta_key(name, entry_id), job_meta_key(name, entry_id))
+                for entry_id, _ in entries
+            ])
+    if dry_run:
+        return moved
+
+    m.move([
+        (legacy_queue_meta_key(name), queue_meta_key(name)),
+        (legacy_stats_completed_key(name), stats_completed_key(name)),
+        (legacy_stats_failed_key(name), stats_failed_key(name)),
+        (legacy_dedupe_key(name), dedupe_key(name)),
+    ])
+    if m.move([(old_sk, stream_key(name))]):
+        convert_group(m.dst, stream_key(name), legacy_consumer_group(name), consumer_group(name))
+    if not m.same_server:
+        m.dst.sadd(queue_set_key(), name)
+        if m.delete_source:
+            m.src.srem(queue_set_key(), name)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="starq-migrate",
+        description="Move Starq data to the hash-tagged key layout (stop the API first)",
+    )
+    parser.add_argument("--source", default=settings.redis_url, help="Redis URL holding the old layout")
+    parser.add_argument("--target", default=None, help="Copy to this Redis instead of renaming in place")
+    parser.add_argument("--target-cluster", action="store_true", help="Target is a Redis Cluster")
+    parser.add_argument("--delete-source", action="store_true", help="Delete source keys after copying")
+    parser.add_argument("-q", "--queue", action="append", default=None, help="Only migrate this queue (repeatable)")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    args = parser.parse_args()
+
+    if args.target is None and (args.target_cluster or args.delete_source):
+        parser.error("--target-cluster and --delete-source require --target")
+
+    m = Mover(args.source, args.target, args.target_cluster, args.delete_source)
+    names = args.queue or sorted(m.src.smembers(queue_set_key()))
+    todo = [n for n in names if m.src.exists(legacy_stream_key(n), legacy_queue_meta_key(n))]
+    if not todo:
+        print("Nothing to migrate")
+        sys.exit(0)
+
+    for name in todo:
+        moved = migrate_queue(m, name, args.dry_run)
+        verb = "would move" if args.dry_run else "moved"
+        print(f"  {name:20s}  {verb} {moved} jobs")
+    print("Done" if not args.dry_run else "Dry run — nothing changed")
+
+
+if __name__ == "__main__":
+    main()
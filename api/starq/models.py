@@ -11,9 +11,20 @@ from pydantic import BaseModel, Field
 class QueueCreate(BaseModel):
     name: str = Field(..., pattern=r"^[a-z0-9][a-z0-9._-]*$", max_length=128)
     description: str = ""
-    max_retries: int = 3
-    claim_timeout: int = 600  # seconds
+    max_retries: int = Field(3, ge=0)
+    claim_timeout: int = Field(600, ge=0)  # seconds
     dedupe: bool = False
+    partitions: int = Field(1, ge=1, le=64)  # streams the queue is spread over
+    partition_key: str = ""  # payload field that picks the partition ("" = round-robin)
+
+
+class QueueUpdate(BaseModel):
+    """Partial update of a queue's settings. Omitted fields are left unchanged."""
+
+    description: str | None = None
+    max_retries: int | None = Field(None, ge=0)
+    claim_timeout: int | None = Field(None, ge=0)  # seconds
+    dedupe: bool | None = None
 
 
 class QueueInfo(BaseModel):
@@ -22,14 +33,29 @@ class QueueInfo(BaseModel):
     max_retries: int = 3
     claim_timeout: int = 600
     dedupe: bool = False
+    partitions: int = 1
+    partition_key: str = ""
     pending: int = 0
     claimed: int = 0
+    waiting: int = 0  # held back until their dependencies complete
     completed: int = 0
     failed: int = 0
 
 
 class QueueList(BaseModel):
     queues: list[QueueInfo]
+    cursor: str = ""  # pass back for the next page ("" = no more)
+    has_more: bool = False
+    total: int = 0  # queues matching the prefix, over all pages
+
+
+class QueueDeletion(BaseModel):
+    queue: str
+    status: str = "running"  # running | done
+    total: int = 0  # jobs to remove
+    deleted: int = 0
+    started_at: str = ""
+    finished_at: str = ""
 
 
 # --- Job ---
@@ -38,6 +64,7 @@ class QueueList(BaseModel):
 class JobSubmit(BaseModel):
     payload: dict[str, Any] = Field(default_factory=dict)
     priority: int = 0
+    depends_on: list[str] = Field(default_factory=list, max_length=100)  # job IDs in the same queue
 
 
 class JobSubmitBatch(BaseModel):
@@ -47,6 +74,7 @@ class JobSubmitBatch(BaseModel):
 class JobClaim(BaseModel):
     count: int = 1
     block_ms: int = 0
+    worker: str = ""  # lease owner, see JobLeases
 
 
 class JobComplete(BaseModel):
@@ -57,6 +85,28 @@ class JobFail(BaseModel):
     error: str = ""
 
 
+class MultiClaim(BaseModel):
+    queues: list[str] = Field(..., min_length=1, max_length=64)  # in priority order
+    weights: dict[str, float] = Field(default_factory=dict)  # set to pick queues at random in proportion instead
+    count: int = 1
+    block_ms: int = 0
+    worker: str = ""  # lease owner, see JobLeases
+
+
+class JobCompletion(BaseModel):
+    id: str
+    result: dict[str, Any] = Field(default_factory=dict)
+
+
+class JobCompleteBatch(BaseModel):
+    jobs: list[JobCompletion]
+
+
+class JobLeases(BaseModel):
+    ids: list[str]
+    worker: str = ""  # only jobs claimed under this name are renewed
+
+
 class JobInfo(BaseModel):
     id: str
     queue: str
@@ -72,7 +122,7 @@ class JobInfo(BaseModel):
 
 class JobListResponse(BaseModel):
     jobs: list[JobInfo]
-    cursor: str = ""  # stream ID for next page ("" = no more)
+    cursor: str = ""  # where the next page starts ("" = no more)
     has_more: bool = False
 
 
@@ -0,0 +1,117 @@
+"""Process-local cache of queue metadata.
+
+Hot paths (submit, claim, fail and the reclaim sweep) read queue settings from
+here instead of issuing HGETALL on every call. Whoever changes a queue publishes
+its name on ``config_channel()`` and every replica drops its cached copy. Entries
+also expire after ``settings.queue_config_ttl`` in case a message is missed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+
+from starq.config import settings
+from starq.redis_client import config_channel, get_pubsub, get_redis, queue_meta_key
+
+logger = logging.getLogger("starq")
+
+_cache: dict[str, tuple[float, dict[str, str]]] = {}
+_generation = 0  # bumped on every invalidation so in-flight loads don't cache stale data
+
+
+async def get_queue_config(name: str) -> dict[str, str]:
+    """Return the queue's metadata hash, or an empty dict if the queue does not exist.
+
+    Always loaded from the primary: a lagging replica could otherwise get a
+    stale (or missing) config cached for everyone.
+    """
+    cached = _cached(name)
+    if cached is not None:
+        return cached
+
+    now = time.monotonic()
+    generation = _generation
+    r = get_redis()
+    meta = await r.hgetall(queue_meta_key(name))
+    await r.aclose()
+    if generation == _generation:
+        _cache[name] = (now, meta)
+    return meta
+
+
+def _cached(name: str) -> dict[str, str] | None:
+    cached = _cache.get(name)
+    if cached and time.monotonic() - cached[0] < settings.queue_config_ttl:
+        return cached[1]
+    return None
+
+
+async def queue_configs(r, names: list[str]) -> dict[str, dict[str, str]]:
+    """Metadata for a page of listed queues: fresh cache entries, the rest in one pipeline on ``r``.
+
+    Listings pass a replica connection. What they load is not cached, so a
+    lagging replica never feeds stale settings to the hot paths.
+    """
+    configs = {name: meta for name in names if (meta := _cached(name)) is not None}
+    missing = [name for name in names if name not in configs]
+    if missing:
+        pipe = r.pipeline()
+        for name in missing:
+            pipe.hgetall(queue_meta_key(name))
+        configs.update(zip(missing, await pipe.execute()))
+    return configs
+
+
+async def preload(names: list[str]):
+    """Cache every named queue's config from the primary, in one pipeline (startup warmup)."""
+    now = time.monotonic()
+    generation = _generation
+    r = get_redis()
+    try:
+        configs = await queue_configs(r, names)
+    finally:
+        await r.aclose()
+    if generation == _generation:
+        _cache.update((name, (now, meta)) for name, meta in configs.items())
+
+
+def partition_count(meta: dict[str, str]) -> int:
+    return int(meta.get("partitions", 1))
+
+
+def invalidate(name: str | None = None):
+    """Drop one queue (or every queue) from this process's cache."""
+    global _generation
+    _generation += 1
+    if name is None:
+        _cache.clear()
+    else:
+        _cache.pop(name, None)
+
+
+async def publish_change(r, name: str):
+    """Invalidate ``name`` here and on every other replica."""
+    invalidate(name)
+    await r.publish(config_channel(), name)
+
+
+async def watch_config_changes():
+    """Background task: drop cached entries when any replica publishes a change."""
+    while True:
+        pubsub = get_pubsub()
+        try:
+            await pubsub.subscribe(config_channel())
+            # Anything may have changed while we were not subscribed
+            invalidate()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    invalidate(message["data"])
+        except asyncio.CancelledError:
+            break
+        except Exception as e:
+            logger.error(f"Queue config watcher error: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
@@ -1,10 +1,56 @@
 from __future__ import annotations
 
+import asyncio
+import itertools
+import logging
+import time
+
 import redis.asyncio as redis
+from redis.asyncio.cluster import RedisCluster
 
 from starq.config import settings
+from starq.metrics import MULTIPROCESS, REDIS_POOL, instrument_pipeline, observe_redis
+
+logger = logging.getLogger("starq")
 
 pool: redis.ConnectionPool | None = None
+cluster: RedisCluster | None = None
+pubsub_client: redis.Redis | None = None
+replica_pools: dict[str, redis.ConnectionPool] = {}
+_replica_health: dict[str, tuple[float, bool]] = {}  # url -> (checked at, usable)
+_primary_offsets: list[tuple[float, int]] = []  # (sampled at, primary replication offset), oldest first
+_replica_rotation = itertools.count()
+
+
+class _Redis(redis.Redis):
+    """Redis client that records per-command latency."""
+
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            observe_redis(str(args[0]).upper(), time.perf_counter() - start)
+
+    def pipeline(self, transaction: bool = True, shard_hint=None):
+        return instrument_pipeline(super().pipeline(transaction, shard_hint))
+
+
+class _SharedCluster(RedisCluster):
+    """One cluster client is shared by every request, so per-request ``aclose()`` is a no-op."""
+
+    async def aclose(self, *args, **kwargs):
+        pass
+
+    async def execute_command(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **kwargs)
+        finally:
+            observe_redis(str(args[0]).upper(), time.perf_counter() - start)
+
+    def pipeline(self, transaction=None, shard_hint=None):
+        return instrument_pipeline(super().pipeline(transaction, shard_hint))
 
 
 def get_pool() -> redis.ConnectionPool:
@@ -14,46 +60,300 @@ def get_pool() -> redis.ConnectionPool:
     return pool
 
 
-def get_redis() -> redis.Redis:
-    return redis.Redis(connection_pool=get_pool())
+def _pool_size(state: str) -> int:
+    if pool is None:
+        return 0
+    if state == "in_use":
+        return len(pool._in_use_connections)
+    if state == "idle":
+        return len(pool._available_connections)
+    return pool.max_connections
+
+
+def record_pool_size():
+    """Write the pool gauges now. Multiprocess metrics can't call back, so this runs on a timer there."""
+    for state in ("in_use", "idle", "max"):
+        REDIS_POOL.labels(state).set(_pool_size(state))
+
+
+if not MULTIPROCESS:
+    for _state in ("in_use", "idle", "max"):
+        REDIS_POOL.labels(_state).set_function(lambda state=_state: _pool_size(state))
+
+
+def get_redis() -> redis.Redis | RedisCluster:
+    global cluster
+    if settings.redis_cluster:
+        if cluster is None:
+            cluster = _SharedCluster.from_url(settings.redis_url, decode_responses=True)
+        return cluster
+    return _Redis(connection_pool=get_pool())
+
+
+def get_pubsub() -> redis.client.PubSub:
+    """Pub/sub connection. In cluster mode PUBLISH reaches every node, so the seed node will do."""
+    global pubsub_client
+    if not settings.redis_cluster:
+        return get_redis().pubsub()
+    if pubsub_client is None:
+        pubsub_client = redis.Redis.from_url(settings.redis_url, decode_responses=True)
+    return pubsub_client.pubsub()
+
+
+def _replica_pool(url: str) -> redis.ConnectionPool:
+    if url not in replica_pools:
+        replica_pools[url] = redis.ConnectionPool.from_url(
+            url, decode_responses=True,
+            socket_connect_timeout=settings.replica_timeout, socket_timeout=settings.replica_timeout,
+        )
+    return replica_pools[url]
+
+
+async def _lagged_offset(now: float) -> int | None:
+    """Sample the primary's replication offset and return the one it had ``replica_max_lag`` seconds ago.
+
+    That is the latest sample at least that old; None until there is one.
+    """
+    r = get_redis()
+    try:
+        offset = (await r.info("replication"))["master_repl_offset"]
+    finally:
+        await r.aclose()
+    _primary_offsets.append((now, offset))
+    old = [i for i, (sampled, _) in enumerate(_primary_offsets) if now - sampled >= settings.replica_max_lag]
+    if not old:
+        return None
+    del _primary_offsets[:old[-1]]
+    return _primary_offsets[0][1]
+
+
+async def _replica_usable(url: str) -> bool:
+    """A replica is usable while its link is up and it is no more than ``replica_max_lag`` seconds behind.
+
+    Lag is judged by replication offset: the replica must have reached the
+    offset the primary had ``replica_max_lag`` seconds ago. (The replica's
+    ``master_last_io_seconds_ago`` only says how long the link has been idle,
+    which reaches the primary's ping period on a quiet primary.)
+    """
+    now = time.monotonic()
+    checked = _replica_health.get(url)
+    if checked and now - checked[0] < settings.replica_check_interval:
+        return checked[1]
+
+    r = _Redis(connection_pool=_replica_pool(url))
+    try:
+        lagged = await _lagged_offset(now)
+        info = await r.info("replication")
+        usable = (
+            info.get("master_link_status") == "up"
+            and not info.get("master_sync_in_progress")
+            and (lagged is None or info.get("slave_repl_offset", -1) >= lagged)
+        )
+    except Exception:
+        usable = False
+    finally:
+        await r.aclose()
+    _replica_health[url] = (now, usable)
+    return usable
+
+
+async def run_read(fn, *args):
+    """Run read-only ``fn(r, *args)`` on a usable replica, falling back to the primary.
+
+    Without replicas configured (or in cluster mode) this just uses the primary.
+    """
+    urls = [] if settings.redis_cluster else settings.replica_urls
+    start = next(_replica_rotation)
+    for i in range(len(urls)):
+        url = urls[(start + i) % len(urls)]
+        if not await _replica_usable(url):
+            continue
+        r = _Redis(connection_pool=_replica_pool(url))
+        try:
+            return await fn(r, *args)
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            logger.warning(f"Replica {url} failed, falling back: {e}")
+            _replica_health[url] = (time.monotonic(), False)
+        finally:
+            await r.aclose()
+
+    r = get_redis()
+    try:
+        return await fn(r, *args)
+    finally:
+        await r.aclose()
+
+
+async def warm_pool(connections: int):
+    """Open ``connections`` connections to the primary and check every replica ahead of the first request."""
+
+    async def ping():
+        r = get_redis()
+        try:
+            await r.ping()
+        finally:
+            await r.aclose()
+
+    # Concurrent pings each hold a connection, so the pool ends up with this many
+    await asyncio.gather(*[ping() for _ in range(connections)])
+    if not settings.redis_cluster:
+        for url in settings.replica_urls:
+            await _replica_usable(url)
 
 
 async def close_pool():
-    global pool
+    global pool, cluster, pubsub_client
     if pool is not None:
         await pool.aclose()
         pool = None
+    for replica_pool in replica_pools.values():
+        await replica_pool.aclose()
+    replica_pools.clear()
+    if cluster is not None:
+        await RedisCluster.aclose(cluster)
+        cluster = None
+    if pubsub_client is not None:
+        await pubsub_client.aclose()
+        pubsub_client = None
 
 
 # --- Key helpers ---
+#
+# Every per-queue key carries the queue name as a hash tag ("{name}"), so all of
+# a queue's keys live in one cluster slot (multi-key commands and pipelines stay
+# on one node) while different queues spread across shards. Keys written by
+# older releases are converted with ``starq-migrate``.
+#
+# A partitioned queue has one stream per partition. Partition 0 uses the queue's
+# own tag; partition p > 0 uses "{name@p}" so partitions spread across shards
+# too. Job hashes live next to their stream, and job IDs from partition p > 0
+# are "<entry_id>@p" so the partition can be recovered from the ID alone.
+#
+# Jobs submitted with ``depends_on`` are not in a stream until their parents
+# finish, so their ID is random ("<hex>[@p]") and the stream entry that
+# releases them carries it in a ``job`` field.
 
 def queue_set_key() -> str:
     return "starq:queues"
 
 
+def leader_key() -> str:
+    return "starq:leader"
+
+
+def queue_index_key() -> str:
+    """Every queue name with score 0, so ZRANGEBYLEX pages through them in name order."""
+    return "starq:queues:index"
+
+
+def queue_rank_key(sort: str) -> str:
+    """Queues scored by ``failed`` (kept exact) or ``depth`` (pending jobs, refreshed by the reclaim sweep).
+
+    Scores are only ever updated with XX, so a deleted queue is not added back.
+    """
+    return f"starq:queues:by:{sort}"
+
+
+def queue_tag(name: str) -> str:
+    return f"starq:{{{name}}}"
+
+
+def partition_tag(name: str, partition: int) -> str:
+    return queue_tag(name) if partition == 0 else f"starq:{{{name}@{partition}}}"
+
+
+def make_job_id(entry_id: str, partition: int) -> str:
+    return entry_id if partition == 0 else f"{entry_id}@{partition}"
+
+
+def split_job_id(job_id: str) -> tuple[str, int]:
+    """Return ``(stream entry ID, partition)`` for a job ID.
+
+    For a dependent job the first part is its random ID, not a stream entry ID.
+    """
+    entry_id, _, partition = job_id.partition("@")
+    return entry_id, int(partition) if partition.isdigit() else 0
+
+
+def stream_job_id(entry_id: str, partition: int, fields: dict | None) -> str:
+    """Job ID of a stream entry: the entry's own ID, or the dependent job it released."""
+    return (fields or {}).get("job") or make_job_id(entry_id, partition)
+
+
 def queue_meta_key(name: str) -> str:
-    return f"starq:queue:{name}"
+    return f"{queue_tag(name)}:meta"
 
 
-def stream_key(name: str) -> str:
-    return f"starq:stream:{name}"
+def stream_key(name: str, partition: int = 0) -> str:
+    return f"{partition_tag(name, partition)}:stream"
 
 
 def consumer_group(name: str) -> str:
-    return name
+    # Same group on every stream, so one XREADGROUP can read several streams at once
+    return "starq"
 
 
 def job_meta_key(queue: str, job_id: str) -> str:
-    return f"starq:job:{queue}:{job_id}"
+    entry_id, partition = split_job_id(job_id)
+    return f"{partition_tag(queue, partition)}:job:{entry_id}"
+
+
+def children_key(queue: str, job_id: str) -> str:
+    """Dependent jobs still waiting for ``job_id`` to finish."""
+    entry_id, partition = split_job_id(job_id)
+    return f"{partition_tag(queue, partition)}:children:{entry_id}"
+
+
+def waiting_key(name: str) -> str:
+    """Sorted set of the queue's dependent jobs not yet released, scored by submit time."""
+    return f"{queue_tag(name)}:waiting"
+
+
+def cancelled_jobs_key(name: str) -> str:
+    """Sorted set of the queue's jobs failed because a dependency failed, scored by when.
+
+    They never reach a stream, so listings find them here.
+    """
+    return f"{queue_tag(name)}:cancelled:jobs"
 
 
 def stats_completed_key(name: str) -> str:
-    return f"starq:stats:{name}:completed"
+    return f"{queue_tag(name)}:completed"
 
 
 def stats_failed_key(name: str) -> str:
-    return f"starq:stats:{name}:failed"
+    return f"{queue_tag(name)}:failed"
+
+
+def stats_cancelled_key(name: str) -> str:
+    """Failed jobs that never reached the stream because a dependency failed."""
+    return f"{queue_tag(name)}:cancelled"
 
 
 def dedupe_key(name: str) -> str:
-    return f"starq:dedupe:{name}"
+    return f"{queue_tag(name)}:dedupe"
+
+
+def archive_key(name: str) -> str:
+    """List of finished job IDs waiting to be written to the archive."""
+    return f"{queue_tag(name)}:archive"
+
+
+def trash_stream_key(name: str, delete_id: str, partition: int = 0) -> str:
+    return f"{partition_tag(name, partition)}:trash:{delete_id}"
+
+
+def trash_waiting_key(name: str, delete_id: str) -> str:
+    return f"{queue_tag(name)}:trash:{delete_id}:waiting"
+
+
+def deletion_key(name: str) -> str:
+    return f"{queue_tag(name)}:deletion"
+
+
+def deletion_set_key() -> str:
+    return "starq:deletions"
+
+
+def config_channel() -> str:
+    return "starq:config"
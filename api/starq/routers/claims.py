@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import random
+import time
+from collections import Counter
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from starq import lifecycle, wire
+from starq.auth import verify_api_key
+from starq.claiming import read_new, rotate
+from starq.config import settings
+from starq.metrics import CLAIM_WORK, JOBS
+from starq.models import ClaimedJobs, MultiClaim
+from starq.queue_config import get_queue_config, partition_count
+from starq.redis_client import consumer_group, get_redis, stream_key
+from starq.routers.jobs import CONSUMER, claim_entry, claim_stale_many
+
+router = APIRouter(tags=["jobs"])
+
+
+def _queue_order(names: list[str], weights: dict[str, float]) -> list[str]:
+    """Queues in the order to try them: as given, or a weighted random order.
+
+    Sorting by ``random() ** (1 / weight)`` puts each queue first with
+    probability proportional to its weight. Queues without a weight count as 1.
+    """
+    if not weights:
+        return names
+    return sorted(names, key=lambda n: random.random() ** (1 / weights.get(n, 1.0)), reverse=True)
+
+
+@router.post("/claim", response_model=ClaimedJobs, dependencies=[Depends(verify_api_key)])
+async def claim_many(
+    body: MultiClaim = Depends(wire.body(MultiClaim)),
+    media_type: str = Depends(wire.negotiate),
+):
+    """Claim up to ``count`` jobs from several queues with one long-poll.
+
+    Queues are tried in list order (or a weighted random order if ``weights``
+    is set): stale jobs first, then new entries, each checked across all
+    queues in one pipelined pass so only streams with work are read. If every
+    queue is empty the
+    request blocks on all of their streams at once and returns jobs from
+    whichever gets work first. Every stream shares one consumer group name,
+    which is what lets a single XREADGROUP span queues.
+    """
+    started = time.perf_counter()
+    compact = wire.compact(media_type)
+    blocked = 0.0
+
+    names = list(dict.fromkeys(body.queues))
+    for name, weight in body.weights.items():
+        if name not in names or weight <= 0:
+            raise HTTPException(status_code=422, detail=f"Weight for '{name}' must be positive and name a listed queue")
+    metas = {}
+    for name in names:
+        metas[name] = await get_queue_config(name)
+        if not metas[name]:
+            raise HTTPException(status_code=404, detail=f"Queue '{name}' not found")
+    if sum(map(partition_count, metas.values())) > settings.claim_max_streams:
+        raise HTTPException(
+            status_code=422, detail=f"Queues span more than {settings.claim_max_streams} partition streams"
+        )
+
+    if lifecycle.draining():
+        return wire.claimed([], media_type) if compact else ClaimedJobs(jobs=[])
+
+    r = get_redis()
+    now = str(int(time.time()))
+    targets: list[tuple[str, dict, int]] = []
+    streams: list[tuple[str, int]] = []
+    for name in _queue_order(names, body.weights):
+        partitions = rotate(list(range(partition_count(metas[name]))))
+        targets.extend((name, metas[name], p) for p in partitions)
+        streams.extend((name, p) for p in partitions)
+    claimed = await claim_stale_many(r, targets, body.count, now, body.worker, compact)
+
+    remaining = body.count - len(claimed)
+    if remaining > 0:
+        try:
+            entries, blocked = await read_new(
+                r, [stream_key(name, p) for name, p in streams],
+                consumer_group(names[0]), CONSUMER, remaining, body.block_ms,
+            )
+            for i, entry_id, fields in entries:
+                name, p = streams[i]
+                claimed.append(await claim_entry(r, name, entry_id, p, fields, now, body.worker, compact))
+        except Exception:
+            pass
+
+    await r.aclose()
+    per_queue = Counter(job[0] if compact else job.queue for job in claimed)
+    for name, n in per_queue.items():
+        JOBS.labels(name, "claimed").inc(n)
+    CLAIM_WORK.observe(time.perf_counter() - started - blocked)
+    if compact:
+        return wire.claimed(claimed, media_type, with_queue=True)
+    return ClaimedJobs(jobs=claimed)
@@ -1,41 +1,67 @@
 from __future__ import annotations
 
 import hashlib
+import itertools
 import json
+import random
+import re
 import time
+import uuid
+import zlib
 
 from fastapi import APIRouter, Depends, HTTPException
 
+from starq import archive, dependencies, lifecycle, wire
 from starq.auth import verify_api_key
+from starq.claiming import read_new, rotate
 from starq.config import settings
+from starq.metrics import CLAIM_WORK, JOBS
 from starq.models import (
     ClaimedJobs,
     JobClaim,
     JobComplete,
+    JobCompleteBatch,
     JobFail,
     JobInfo,
+    JobLeases,
     JobListResponse,
     JobSubmit,
     JobSubmitBatch,
 )
+from starq.queue_config import get_queue_config, partition_count
 from starq.redis_client import (
+    cancelled_jobs_key,
     consumer_group,
     dedupe_key,
     get_redis,
     job_meta_key,
-    queue_meta_key,
-    queue_set_key,
+    make_job_id,
+    queue_rank_key,
+    run_read,
+    split_job_id,
     stats_completed_key,
     stats_failed_key,
+    stream_job_id,
     stream_key,
+    waiting_key,
 )
 
 router = APIRouter(prefix="/queues/{name}/jobs", tags=["jobs"])
 
+_submit_rotation = itertools.count(random.randrange(1 << 16))
 
-async def _ensure_queue(r, name: str):
-    if not await r.sismember(queue_set_key(), name):
+_ENTRY_ID = re.compile(r"\d+-\d+")
+
+CONSUMER = "w"  # every claim uses the same consumer; the job hash records which worker holds the lease
+
+_NEW_ENTRY_MS = 10_000  # a stream entry this young may be missing its hash because the submit is still writing it
+
+
+async def _ensure_queue(name: str) -> dict[str, str]:
+    meta = await get_queue_config(name)
+    if not meta:
         raise HTTPException(status_code=404, detail=f"Queue '{name}' not found")
+    return meta
 
 
 def _job_info_from_meta(queue: str, job_id: str, meta: dict) -> JobInfo:
@@ -66,19 +92,58 @@ def _job_info_from_meta(queue: str, job_id: str, meta: dict) -> JobInfo:
     )
 
 
+def _entry_order(entry_id: str) -> tuple[int, int]:
+    ts, seq = entry_id.split("-")
+    return int(ts), int(seq)
+
+
 def _payload_hash(payload: dict) -> str:
     return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
 
 
+def _stream_entry(job_id: str, entry: str | None) -> str | None:
+    """A job's stream entry ID: the job ID itself, or the ``entry`` recorded when a dependent job was released."""
+    entry_id, _ = split_job_id(job_id)
+    return entry_id if _ENTRY_ID.fullmatch(entry_id) else entry
+
+
+def _entries_by_partition(jobs: dict[str, str | None], partitions: int) -> dict[int, dict[str, str]]:
+    """Group ``{job ID: stored entry}`` by partition as ``{stream entry ID: job ID}``.
+
+    Jobs without a stream entry (malformed IDs, partitions the queue doesn't
+    have, or still waiting) are dropped.
+    """
+    grouped: dict[int, dict[str, str]] = {}
+    for job_id, entry in jobs.items():
+        entry_id = _stream_entry(job_id, entry)
+        partition = split_job_id(job_id)[1]
+        if entry_id and partition < partitions:
+            grouped.setdefault(partition, {})[entry_id] = job_id
+    return grouped
+
+
+def _pick_partition(job: JobSubmit, partitions: int, partition_key: str) -> int:
+    """Route by the payload's ``partition_key`` field if set and present, else round-robin."""
+    if partitions == 1:
+        return 0
+    if partition_key and partition_key in job.payload:
+        value = json.dumps(job.payload[partition_key], sort_keys=True).encode()
+        return zlib.crc32(value) % partitions
+    return next(_submit_rotation) % partitions
+
+
 @router.post("", dependencies=[Depends(verify_api_key)])
-async def submit_jobs(name: str, body: JobSubmit | JobSubmitBatch):
+async def submit_jobs(
+    name: str,
+    body: JobSubmit | JobSubmitBatch = Depends(wire.body(JobSubmit | JobSubmitBatch)),
+    media_type: str = Depends(wire.negotiate),
+):
     r = get_redis()
-    await _ensure_queue(r, name)
+    queue_meta = await _ensure_queue(name)
 
     jobs_to_submit = body.jobs if isinstance(body, JobSubmitBatch) else [body]
 
     # Check if dedupe is enabled
-    queue_meta = await r.hgetall(queue_meta_key(name))
     is_dedupe = queue_meta.get("dedupe", "0") == "1"
 
     # Filter duplicates if dedupe enabled
@@ -97,112 +162,331 @@ async def submit_jobs(name: str, body: JobSubmit | JobSubmitBatch):
         accepted = [(i, job, "") for i, job in enumerate(jobs_to_submit)]
 
     result = []
-    sk = stream_key(name)
+    job_ids: list[str] = []
+    partitions = partition_count(queue_meta)
+    partition_key = queue_meta.get("partition_key", "")
     now = str(int(time.time()))
 
     if accepted:
-        # Add all jobs to stream in a pipeline
-        pipe = r.pipeline()
-        for _, job, _ in accepted:
-            pipe.xadd(sk, {"payload": json.dumps(job.payload), "priority": str(job.priority)})
-        xadd_results = await pipe.execute()
+        parents = {parent for _, job, _ in accepted for parent in job.depends_on}
+        unknown = await dependencies.unknown_jobs(r, name, parents) if parents else []
+        if unknown:
+            await r.aclose()
+            raise HTTPException(status_code=404, detail=f"Job '{unknown[0]}' not found")
+
+        # Add all jobs to their partition's stream in a pipeline. Jobs with
+        # dependencies only get an ID for now; they are added once released.
+        targets = [_pick_partition(job, partitions, partition_key) for _, job, _ in accepted]
+        entry_ids = []
+        if not all(job.depends_on for _, job, _ in accepted):
+            pipe = r.pipeline()
+            for (_, job, _), p in zip(accepted, targets):
+                if not job.depends_on:
+                    pipe.xadd(stream_key(name, p), {"payload": json.dumps(job.payload), "priority": str(job.priority)})
+            entry_ids = await pipe.execute()
+        new_entries = iter(entry_ids)
+        job_ids = [
+            make_job_id(uuid.uuid4().hex if job.depends_on else next(new_entries), p)
+            for (_, job, _), p in zip(accepted, targets)
+        ]
 
         # Store metadata + add dedupe hashes in a second pipeline
         pipe = r.pipeline()
         for idx, (_, job, h) in enumerate(accepted):
-            job_id = xadd_results[idx]
+            job_id = job_ids[idx]
             meta = {
                 "status": "pending",
                 "payload": json.dumps(job.payload),
                 "created_at": now,
                 "retries": "0",
             }
+            if job.depends_on:
+                meta["status"] = "waiting"
+                meta["priority"] = str(job.priority)
+                meta["deps_remaining"] = str(len(set(job.depends_on)))
+                pipe.zadd(waiting_key(name), {job_id: time.time() * 1000})
             if is_dedupe and h:
                 meta["dedupe_hash"] = h
                 pipe.sadd(dedupe_key(name), h)
             pipe.hset(job_meta_key(name, job_id), mapping=meta)
         await pipe.execute()
 
-        for idx, (_, job, _) in enumerate(accepted):
-            result.append(JobInfo(
-                id=xadd_results[idx],
-                queue=name,
-                status="pending",
-                payload=job.payload,
-                created_at=now,
-            ))
+        edges = [
+            (job_id, parent)
+            for job_id, (_, job, _) in zip(job_ids, accepted)
+            for parent in dict.fromkeys(job.depends_on)
+        ]
+        released, failed = await dependencies.register(r, name, edges)
+
+        if not wire.compact(media_type):
+            for idx, (_, job, _) in enumerate(accepted):
+                status = "pending"
+                if job_ids[idx] in failed:
+                    status = "failed"
+                elif job.depends_on and job_ids[idx] not in released:
+                    status = "waiting"
+                result.append(JobInfo(
+                    id=job_ids[idx],
+                    queue=name,
+                    status=status,
+                    payload=job.payload,
+                    created_at=now,
+                ))
 
     await r.aclose()
+    JOBS.labels(name, "submitted").inc(len(accepted))
+    if wire.compact(media_type):
+        return wire.reply({"ids": job_ids, "submitted": len(accepted), "skipped": skipped}, media_type)
     return {"jobs": result, "submitted": len(accepted), "skipped": skipped}
 
 
 @router.post("/claim", response_model=ClaimedJobs, dependencies=[Depends(verify_api_key)])
-async def claim_jobs(name: str, body: JobClaim):
+async def claim_jobs(
+    name: str,
+    body: JobClaim = Depends(wire.body(JobClaim)),
+    media_type: str = Depends(wire.negotiate),
+):
+    """Claim up to ``count`` jobs, long-polling for ``block_ms`` if none are ready.
+
+    Compact formats return ``(id, payload, retries)`` straight from the stream
+    entries, skipping the HGETALL per job that full ``JobInfo`` needs.
+    """
+    started = time.perf_counter()
+    compact = wire.compact(media_type)
+    blocked = 0.0
+    meta = await _ensure_queue(name)
+    if lifecycle.draining():
+        return wire.claimed([], media_type) if compact else ClaimedJobs(jobs=[])
     r = get_redis()
-    await _ensure_queue(r, name)
 
-    sk = stream_key(name)
-    cg = consumer_group(name)
+    # Start at a different partition on each call so all of them get drained
+    partitions = rotate(list(range(partition_count(meta))))
     now = str(int(time.time()))
-    claimed = []
 
-    # First try to autoclaim stale jobs
-    meta = await r.hgetall(queue_meta_key(name))
-    claim_timeout_ms = int(meta.get("claim_timeout", 600)) * 1000
-
-    consumer = "w"
-
-    try:
-        stale_result = await r.xautoclaim(sk, cg, consumer, min_idle_time=claim_timeout_ms, start_id="0-0", count=body.count)
-        if stale_result and len(stale_result) > 1 and stale_result[1]:
-            for entry_id, fields in stale_result[1]:
-                jmk = job_meta_key(name, entry_id)
-                retries = int(await r.hget(jmk, "retries") or 0)
-                await r.hset(jmk, mapping={
-                    "status": "claimed",
-                    "claimed_at": now,
-                    "retries": str(retries + 1),
-                })
-                job_meta = await r.hgetall(jmk)
-                claimed.append(_job_info_from_meta(name, entry_id, job_meta))
-    except Exception:
-        pass
+    # First try to autoclaim stale jobs, on every partition
+    targets = [(name, meta, p) for p in partitions]
+    claimed = await claim_stale_many(r, targets, body.count, now, body.worker, compact)
 
     # Then read new jobs if we need more
     remaining = body.count - len(claimed)
     if remaining > 0:
         try:
-            results = await r.xreadgroup(
-                cg, consumer, {sk: ">"},
-                count=remaining,
-                block=body.block_ms if body.block_ms > 0 else None,
-            )
-            if results:
-                for _stream, messages in results:
-                    for entry_id, fields in messages:
-                        jmk = job_meta_key(name, entry_id)
-                        await r.hset(jmk, mapping={
-                            "status": "claimed",
-                            "claimed_at": now,
-                        })
-                        job_meta = await r.hgetall(jmk)
-                        claimed.append(_job_info_from_meta(name, entry_id, job_meta))
+            streams = [stream_key(name, p) for p in partitions]
+            entries, blocked = await read_new(r, streams, consumer_group(name), CONSUMER, remaining, body.block_ms)
+            for i, entry_id, fields in entries:
+                claimed.append(await claim_entry(r, name, entry_id, partitions[i], fields, now, body.worker, compact))
         except Exception:
             pass
 
     await r.aclose()
+    if claimed:
+        JOBS.labels(name, "claimed").inc(len(claimed))
+    CLAIM_WORK.observe(time.perf_counter() - started - blocked)
+    if compact:
+        return wire.claimed(claimed, media_type)
     return ClaimedJobs(jobs=claimed)
 
 
-@router.put("/{job_id}/complete", dependencies=[Depends(verify_api_key)])
-async def complete_job(name: str, job_id: str, body: JobComplete):
-    r = get_redis()
-    await _ensure_queue(r, name)
+async def claim_entry(
+    r, name: str, entry_id: str, partition: int, fields: dict | None, now: str, worker: str, compact: bool,
+    retries: int | None = None,
+):
+    """Mark a just-delivered job claimed by ``worker`` and return it for the claim response.
 
+    ``retries`` is the new retry count for a redelivery (None on first delivery).
+    Compact formats get a ``(queue, id, payload, retries)`` tuple built from the
+    stream entry; otherwise the job hash is read back into a ``JobInfo``.
+    """
+    job_id = stream_job_id(entry_id, partition, fields)
     jmk = job_meta_key(name, job_id)
-    if not await r.exists(jmk):
+    mapping = {"status": "claimed", "claimed_at": now, "worker": worker}
+    if retries is not None:
+        mapping["retries"] = str(retries)
+    if job_id != make_job_id(entry_id, partition):
+        mapping["entry"] = entry_id  # A released dependent job; its ID doesn't name the entry
+    await r.hset(jmk, mapping=mapping)
+    if compact:
+        return (name, job_id, (fields or {}).get("payload", "{}"), retries or 0)
+    return _job_info_from_meta(name, job_id, await r.hgetall(jmk))
+
+
+def _claim_timeout_ms(meta: dict) -> int:
+    return int(meta.get("claim_timeout", 600)) * 1000
+
+
+async def _claim_redelivered(
+    r, name: str, partition: int, stale_result, now: str, worker: str, compact: bool, unread: set[str]
+) -> list:
+    """Claim the entries XAUTOCLAIM took over; those in ``unread`` were never handed out."""
+    claimed = []
+    if stale_result and len(stale_result) > 1 and stale_result[1]:
+        for entry_id, fields in stale_result[1]:
+            if entry_id in unread:
+                claimed.append(await claim_entry(r, name, entry_id, partition, fields, now, worker, compact))
+                continue
+            job_id = stream_job_id(entry_id, partition, fields)
+            retries = int(await r.hget(job_meta_key(name, job_id), "retries") or 0)
+            claimed.append(await claim_entry(r, name, entry_id, partition, fields, now, worker, compact, retries + 1))
+    return claimed
+
+
+async def claim_stale_many(
+    r, targets: list[tuple[str, dict, int]], count: int, now: str, worker: str, compact: bool
+) -> list:
+    """Take over up to ``count`` jobs whose claim outlived their queue's ``claim_timeout``.
+
+    ``targets`` are ``(queue, meta, partition)`` tuples, tried in order.
+    XPENDING with IDLE finds the targets holding stale entries without claiming
+    anything, so XAUTOCLAIM only runs (one pipeline) where there are some, and
+    never takes more than ``count`` in total. Entries a claim read but handed
+    back (delivery count 0, see ``claiming.read_new``) don't count a retry.
+    """
+    pipe = r.pipeline()
+    for name, meta, p in targets:
+        pipe.xpending_range(stream_key(name, p), consumer_group(name), "-", "+", count, idle=_claim_timeout_ms(meta))
+    plan = []
+    left = count
+    for (name, meta, p), stale in zip(targets, await pipe.execute(raise_on_error=False)):
+        if left > 0 and stale and not isinstance(stale, Exception):
+            n = min(left, len(stale))
+            unread = {e["message_id"] for e in stale[:n] if e["times_delivered"] == 0}
+            plan.append((name, meta, p, n, unread))
+            left -= n
+    if not plan:
+        return []
+
+    pipe = r.pipeline()
+    for name, meta, p, n, _ in plan:
+        pipe.xautoclaim(
+            stream_key(name, p), consumer_group(name), CONSUMER,
+            min_idle_time=_claim_timeout_ms(meta), start_id="0-0", count=n,
+        )
+    claimed = []
+    for (name, _, p, _, unread), stale_result in zip(plan, await pipe.execute(raise_on_error=False)):
+        if not isinstance(stale_result, Exception):
+            claimed += await _claim_redelivered(r, name, p, stale_result, now, worker, compact, unread)
+    return claimed
+
+
+@router.post("/heartbeat", dependencies=[Depends(verify_api_key)])
+async def heartbeat_jobs(
+    name: str,
+    body: JobLeases = Depends(wire.body(JobLeases)),
+    media_type: str = Depends(wire.negotiate),
+):
+    """Extend the lease on jobs claimed by ``worker`` so the reclaimer leaves them alone.
+
+    Every claim reads as the same stream consumer, so the job hash is what says
+    who holds a job: only jobs still claimed under the caller's ``worker`` name
+    are renewed. XCLAIM with zero min-idle resets each entry's idle time
+    without bumping its delivery count. Returns the IDs that are still held;
+    any others were completed, failed, or reclaimed (by anyone, the caller
+    included) after their lease ran out.
+    """
+    r = get_redis()
+    meta = await _ensure_queue(name)
+
+    # One HMGET per job: its owner, and the stream entry of released dependent jobs
+    ids = list(dict.fromkeys(body.ids))
+    pipe = r.pipeline()
+    for job_id in ids:
+        pipe.hmget(job_meta_key(name, job_id), "status", "worker", "entry")
+    owned = {
+        job_id: entry
+        for job_id, (status, worker, entry) in zip(ids, await pipe.execute() if ids else [])
+        if status == "claimed" and (worker or "") == body.worker
+    }
+
+    by_partition = _entries_by_partition(owned, partition_count(meta))
+    pipe = r.pipeline()
+    for partition, entries in by_partition.items():
+        pipe.xclaim(
+            stream_key(name, partition), consumer_group(name), CONSUMER,
+            min_idle_time=0, message_ids=list(entries), justid=True,
+        )
+    results = await pipe.execute() if by_partition else []
+
+    await r.aclose()
+    held = [
+        by_partition[partition][entry_id]
+        for partition, entry_ids in zip(by_partition, results)
+        for entry_id in entry_ids
+    ]
+    return wire.reply({"jobs": held}, media_type)
+
+
+@router.post("/complete", dependencies=[Depends(verify_api_key)])
+async def complete_jobs(
+    name: str,
+    body: JobCompleteBatch = Depends(wire.body(JobCompleteBatch)),
+    media_type: str = Depends(wire.negotiate),
+):
+    """Complete many jobs in two round trips.
+
+    Unknown IDs, and jobs still waiting on dependencies, are reported back as
+    missing rather than failing the batch.
+    """
+    r = get_redis()
+    meta = await _ensure_queue(name)
+
+    jobs = {job.id: job for job in body.jobs}
+    pipe = r.pipeline()
+    for job_id in jobs:
+        pipe.hmget(job_meta_key(name, job_id), "status", "entry")
+    found = dict(zip(jobs, await pipe.execute())) if jobs else {}
+    done = [job for job in jobs.values() if found[job.id][0] not in (None, "waiting")]
+    missing = [job.id for job in jobs.values() if found[job.id][0] in (None, "waiting")]
+
+    if done:
+        now = str(int(time.time()))
+        pipe = r.pipeline()
+        for job in done:
+            jmk = job_meta_key(name, job.id)
+            pipe.hset(jmk, mapping={
+                "status": "completed",
+                "result": json.dumps(job.result),
+                "completed_at": now,
+            })
+            pipe.expire(jmk, settings.job_meta_ttl)
+        entries_found = {job.id: found[job.id][1] for job in done}
+        for partition, entries in _entries_by_partition(entries_found, partition_count(meta)).items():
+            pipe.xack(stream_key(name, partition), consumer_group(name), *entries)
+        pipe.incrby(stats_completed_key(name), len(done))
+        archive.enqueue(pipe, name, [job.id for job in done])
+        for job in done:
+            dependencies.pop_children(pipe, name, job.id)
+        children = (await pipe.execute())[-len(done):]
+        await dependencies.resolve(r, name, [child for popped in children for child in popped or []])
+
+    await r.aclose()
+    JOBS.labels(name, "completed").inc(len(done))
+    return wire.reply({"completed": [job.id for job in done], "missing": missing}, media_type)
+
+
+async def _finishable_job(r, name: str, job_id: str, *fields: str) -> list:
+    """Read ``status`` and ``fields`` of a job that may be completed or failed: 404 if unknown, 409 if waiting."""
+    values = await r.hmget(job_meta_key(name, job_id), "status", *fields)
+    if values[0] is None:
         await r.aclose()
         raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    if values[0] == "waiting":
+        await r.aclose()
+        raise HTTPException(status_code=409, detail=f"Job '{job_id}' is waiting on its dependencies")
+    return values[1:]
+
+
+@router.put("/{job_id}/complete", dependencies=[Depends(verify_api_key)])
+async def complete_job(
+    name: str,
+    job_id: str,
+    body: JobComplete = Depends(wire.body(JobComplete)),
+    media_type: str = Depends(wire.negotiate),
+):
+    r = get_redis()
+    await _ensure_queue(name)
+
+    jmk = job_meta_key(name, job_id)
+    entry, = await _finishable_job(r, name, job_id, "entry")
 
     now = str(int(time.time()))
     pipe = r.pipeline()
@@ -213,27 +497,35 @@ async def complete_job(name: str, job_id: str, body: JobComplete):
     })
     # Set TTL on completed job metadata so it doesn't accumulate forever
     pipe.expire(jmk, settings.job_meta_ttl)
-    pipe.xack(stream_key(name), consumer_group(name), job_id)
+    entry_id, partition = _stream_entry(job_id, entry), split_job_id(job_id)[1]
+    if entry_id:
+        pipe.xack(stream_key(name, partition), consumer_group(name), entry_id)
     pipe.incr(stats_completed_key(name))
-    await pipe.execute()
+    archive.enqueue(pipe, name, [job_id])
+    dependencies.pop_children(pipe, name, job_id)
+    children = (await pipe.execute())[-1]
+    await dependencies.resolve(r, name, children or [])
 
     await r.aclose()
-    return {"status": "completed", "job_id": job_id}
+    JOBS.labels(name, "completed").inc()
+    return wire.reply({"status": "completed", "job_id": job_id}, media_type)
 
 
 @router.put("/{job_id}/fail", dependencies=[Depends(verify_api_key)])
-async def fail_job(name: str, job_id: str, body: JobFail):
+async def fail_job(
+    name: str,
+    job_id: str,
+    body: JobFail = Depends(wire.body(JobFail)),
+    media_type: str = Depends(wire.negotiate),
+):
     r = get_redis()
-    await _ensure_queue(r, name)
+    meta = await _ensure_queue(name)
 
     jmk = job_meta_key(name, job_id)
-    if not await r.exists(jmk):
-        await r.aclose()
-        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found")
+    retries, entry, dh = await _finishable_job(r, name, job_id, "retries", "entry", "dedupe_hash")
 
-    meta = await r.hgetall(queue_meta_key(name))
     max_retries = int(meta.get("max_retries", 3))
-    retries = int(await r.hget(jmk, "retries") or 0)
+    retries = int(retries or 0)
 
     if retries < max_retries:
         await r.hset(jmk, mapping={
@@ -241,9 +533,9 @@ async def fail_job(name: str, job_id: str, body: JobFail):
             "error": body.error,
             "claimed_at": "",
         })
+        JOBS.labels(name, "retried").inc()
     else:
         # Terminal failure — remove dedupe hash so payload can be retried
-        dh = await r.hget(jmk, "dedupe_hash")
         now = str(int(time.time()))
         pipe = r.pipeline()
         pipe.hset(jmk, mapping={
@@ -252,70 +544,158 @@ async def fail_job(name: str, job_id: str, body: JobFail):
             "completed_at": now,
         })
         pipe.expire(jmk, settings.job_meta_ttl)
-        pipe.xack(stream_key(name), consumer_group(name), job_id)
+        entry_id, partition = _stream_entry(job_id, entry), split_job_id(job_id)[1]
+        if entry_id:
+            pipe.xack(stream_key(name, partition), consumer_group(name), entry_id)
         pipe.incr(stats_failed_key(name))
+        pipe.zadd(queue_rank_key("failed"), {name: 1}, xx=True, incr=True)
         if dh:
             pipe.srem(dedupe_key(name), dh)
-        await pipe.execute()
+        archive.enqueue(pipe, name, [job_id])
+        dependencies.pop_children(pipe, name, job_id)
+        children = (await pipe.execute())[-1]
+        # Jobs waiting on this one can never run now
+        await dependencies.fail_children(r, name, job_id, children or [])
+        JOBS.labels(name, "failed").inc()
 
     await r.aclose()
-    return {"status": "failed", "job_id": job_id, "retries": retries}
-
-
-@router.get("", response_model=JobListResponse)
-async def list_jobs(
-    name: str,
-    status: str | None = None,
-    count: int = 50,
-    cursor: str | None = None,
-):
-    """Cursor-based paginated job listing. Uses XREVRANGE with stream IDs."""
-    r = get_redis()
-    await _ensure_queue(r, name)
+    return wire.reply({"status": "failed", "job_id": job_id, "retries": retries}, media_type)
 
-    sk = stream_key(name)
 
-    # XREVRANGE paginates by using the previous page's last ID minus 1ms
-    max_id = "+"
-    if cursor:
-        # Cursor is the last stream ID from previous page — go before it
-        parts = cursor.split("-")
-        if len(parts) == 2:
-            ts, seq = int(parts[0]), int(parts[1])
-            if seq > 0:
-                max_id = f"{ts}-{seq - 1}"
-            else:
-                max_id = f"{ts - 1}-{2**63 - 1}"
+async def _list_jobs(r, name: str, meta: dict, status: str | None, count: int, cursor: str | None) -> JobListResponse:
+    bound, cursor_partition = split_job_id(cursor) if cursor else ("", 0)
+    if bound and not _ENTRY_ID.fullmatch(bound):
+        bound = ""
 
-    # Fetch one extra to detect has_more
+    # Fetch one extra per partition to detect has_more
     fetch_count = count + 1
-    entries = await r.xrevrange(sk, max=max_id, count=fetch_count)
+    pipe = r.pipeline()
+    for p in range(partition_count(meta)):
+        if not bound:
+            max_id = "+"
+        elif p < cursor_partition:
+            max_id = bound  # Sorts after the cursor on a stream ID tie
+        else:
+            max_id = f"({bound}"
+        pipe.xrevrange(stream_key(name, p), max=max_id, count=fetch_count)
+    entries = sorted(
+        ((entry_id, p, fields) for p, page in enumerate(await pipe.execute()) for entry_id, fields in page),
+        key=lambda e: (_entry_order(e[0]), e[1]),
+        reverse=True,
+    )
 
     has_more = len(entries) > count
     if has_more:
         entries = entries[:count]
 
     # Pipeline all HGETALL calls
+    job_ids = [stream_job_id(entry_id, p, fields) for entry_id, p, fields in entries]
     if entries:
         pipe = r.pipeline()
-        for entry_id, _ in entries:
-            pipe.hgetall(job_meta_key(name, entry_id))
+        for job_id in job_ids:
+            pipe.hgetall(job_meta_key(name, job_id))
         metas = await pipe.execute()
     else:
         metas = []
 
+    # Finished jobs whose hash has expired may still be in the archive
+    archived = await archive.lookup(name, [job_id for job_id, m in zip(job_ids, metas) if not m])
+
+    new_after = int(time.time() * 1000) - _NEW_ENTRY_MS
     jobs = []
-    for i, (entry_id, fields) in enumerate(entries):
-        meta = metas[i] if metas[i] else {
-            "status": "pending",
+    for i, (entry_id, _, fields) in enumerate(entries):
+        # Otherwise the job finished and its hash expired (or is in an archive this host can't see)
+        job_meta = metas[i] or archived.get(job_ids[i]) or {
+            "status": "pending" if _entry_order(entry_id)[0] > new_after else "expired",
             "payload": fields.get("payload", "{}"),
             "created_at": "",
         }
-        job = _job_info_from_meta(name, entry_id, meta)
+        job = _job_info_from_meta(name, job_ids[i], job_meta)
         if status is None or job.status == status:
             jobs.append(job)
 
-    next_cursor = entries[-1][0] if has_more and entries else ""
+    next_cursor = make_job_id(entries[-1][0], entries[-1][1]) if has_more and entries else ""
 
-    await r.aclose()
     return JobListResponse(jobs=jobs, cursor=next_cursor, has_more=has_more)
+
+
+async def _list_set(r, name: str, key: str, count: int, cursor: str | None) -> JobListResponse:
+    """Dependent jobs without a stream entry (waiting, or failed by a dependency), newest first.
+
+    Pages through the sorted set ``key``; the cursor is the last job ID.
+    """
+    start = 0
+    if cursor:
+        rank = await r.zrevrank(key, cursor)
+        start = rank + 1 if rank is not None else 0  # Released since: start over
+    job_ids = await r.zrevrange(key, start, start + count)
+
+    has_more = len(job_ids) > count
+    job_ids = job_ids[:count]
+    pipe = r.pipeline()
+    for job_id in job_ids:
+        pipe.hgetall(job_meta_key(name, job_id))
+    metas = await pipe.execute() if job_ids else []
+    archived = await archive.lookup(name, [job_id for job_id, m in zip(job_ids, metas) if not m])
+
+    jobs = [
+        _job_info_from_meta(name, job_id, m or archived[job_id])
+        for job_id, m in zip(job_ids, metas)
+        if m or job_id in archived
+    ]
+    return JobListResponse(jobs=jobs, cursor=job_ids[-1] if has_more else "", has_more=has_more)
+
+
+_CANCELLED_CURSOR = "cancelled:"
+
+
+async def _list_with_cancelled(
+    r, name: str, meta: dict, status: str | None, count: int, cursor: str | None
+) -> JobListResponse:
+    """Jobs from the streams, then those failed by a dependency, which never reached one.
+
+    Once the streams run out, the cursor switches to ``cancelled:<job ID>``.
+    """
+    if cursor and cursor.startswith(_CANCELLED_CURSOR):
+        jobs = []
+        cursor = cursor.removeprefix(_CANCELLED_CURSOR)
+    else:
+        page = await _list_jobs(r, name, meta, status, count, cursor)
+        if page.has_more:
+            return page
+        jobs = page.jobs
+        cursor = ""
+
+    left = count - len(jobs)
+    if left <= 0:
+        has_more = await r.zcard(cancelled_jobs_key(name)) > 0
+        return JobListResponse(jobs=jobs, cursor=_CANCELLED_CURSOR if has_more else "", has_more=has_more)
+    page = await _list_set(r, name, cancelled_jobs_key(name), left, cursor)
+    return JobListResponse(
+        jobs=jobs + page.jobs,
+        cursor=_CANCELLED_CURSOR + page.cursor if page.has_more else "",
+        has_more=page.has_more,
+    )
+
+
+@router.get("", response_model=JobListResponse)
+async def list_jobs(
+    name: str,
+    status: str | None = None,
+    count: int = 50,
+    cursor: str | None = None,
+):
+    """Cursor-based paginated job listing. Uses XREVRANGE with stream IDs.
+
+    Jobs are ordered newest first by (stream ID, partition), merged across the
+    queue's partitions. The cursor marks the last job of the previous page.
+    Jobs waiting on dependencies are not in a stream yet and are only listed
+    with ``status=waiting``; jobs failed because a dependency failed never will
+    be, and follow the stream jobs when listing all or ``failed`` jobs.
+    """
+    meta = await _ensure_queue(name)
+    if status == "waiting":
+        return await run_read(_list_set, name, waiting_key(name), count, cursor)
+    if status in (None, "failed"):
+        return await run_read(_list_with_cancelled, name, meta, status, count, cursor)
+    return await run_read(_list_jobs, name, meta, status, count, cursor)
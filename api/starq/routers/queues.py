@@ -1,51 +1,65 @@
 from __future__ import annotations
 
 import json
+from typing import Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 
 from starq.auth import verify_api_key
-from starq.models import QueueCreate, QueueInfo, QueueList
+from starq.deletion import deletion_from_status, deletion_in_progress, start_deletion
+from starq.models import QueueCreate, QueueDeletion, QueueInfo, QueueList, QueueUpdate
+from starq.queue_config import get_queue_config, partition_count, publish_change, queue_configs
 from starq.redis_client import (
     consumer_group,
-    dedupe_key,
+    deletion_key,
     get_redis,
+    queue_index_key,
     queue_meta_key,
+    queue_rank_key,
     queue_set_key,
+    stats_cancelled_key,
     stats_completed_key,
     stats_failed_key,
+    run_read,
     stream_key,
+    waiting_key,
 )
 
 router = APIRouter(prefix="/queues", tags=["queues"])
 
 
-async def _queue_info(r, name: str) -> QueueInfo:
-    meta = await r.hgetall(queue_meta_key(name))
-    if not meta:
-        meta = {}
+async def queue_info(r, name: str, meta: dict[str, str] | None = None) -> QueueInfo:
+    if meta is None:
+        meta = await get_queue_config(name)
+    partitions = partition_count(meta)
 
-    # Stream length (total entries still in the stream)
-    sk = stream_key(name)
-    try:
-        stream_len = await r.xlen(sk)
-    except Exception:
-        stream_len = 0
+    # Stream length (total entries still in the stream) and claimed (delivered
+    # to a worker but not yet acked, from XPENDING), summed over partitions
+    pipe = r.pipeline()
+    for p in range(partitions):
+        sk = stream_key(name, p)
+        pipe.xlen(sk)
+        pipe.xpending(sk, consumer_group(name))
+    results = await pipe.execute(raise_on_error=False)
 
-    # Claimed (delivered to a worker but not yet acked) from XPENDING
+    stream_len = 0
     claimed = 0
-    try:
-        info = await r.xpending(sk, consumer_group(name))
-        if info:
-            claimed = info.get("pending", 0) if isinstance(info, dict) else info[0]
-    except Exception:
-        pass
+    for length, info in zip(results[::2], results[1::2]):
+        if isinstance(length, int):
+            stream_len += length
+        if info and not isinstance(info, Exception):
+            claimed += info.get("pending", 0) if isinstance(info, dict) else info[0]
 
-    completed = int(await r.get(stats_completed_key(name)) or 0)
-    failed = int(await r.get(stats_failed_key(name)) or 0)
+    pipe = r.pipeline()
+    pipe.get(stats_completed_key(name))
+    pipe.get(stats_failed_key(name))
+    pipe.get(stats_cancelled_key(name))
+    pipe.zcard(waiting_key(name))
+    completed, failed, cancelled, waiting = [int(n or 0) for n in await pipe.execute()]
 
-    # Pending = jobs in stream not yet claimed, completed, or failed
-    pending = max(0, stream_len - claimed - completed - failed)
+    # Pending = jobs in stream not yet claimed, completed, or failed. Jobs
+    # failed because a dependency failed never reached the stream.
+    pending = max(0, stream_len - claimed - completed - (failed - cancelled))
 
     return QueueInfo(
         name=name,
@@ -53,22 +67,105 @@ async def _queue_info(r, name: str) -> QueueInfo:
         max_retries=int(meta.get("max_retries", 3)),
         claim_timeout=int(meta.get("claim_timeout", 600)),
         dedupe=meta.get("dedupe", "0") == "1",
+        partitions=partitions,
+        partition_key=meta.get("partition_key", ""),
         pending=pending,
         claimed=claimed,
+        waiting=waiting,
         completed=completed,
         failed=failed,
     )
 
 
+RANKINGS = ("depth", "failed")
+
+_RANK_SCAN = 500  # ranking entries read per round trip when filtering by prefix
+
+
+def _prefix_range(prefix: str) -> tuple[str, str]:
+    return (f"[{prefix}", f"[{prefix}\xff") if prefix else ("-", "+")
+
+
+async def _page_by_name(r, prefix: str, count: int, cursor: str) -> tuple[list[str], str]:
+    start = f"({cursor}" if cursor and cursor >= prefix else _prefix_range(prefix)[0]
+    stop = _prefix_range(prefix)[1]
+    names = await r.zrangebylex(queue_index_key(), start, stop, start=0, num=count + 1)
+    return names[:count], names[count - 1] if len(names) > count else ""
+
+
+async def _page_by_rank(r, sort: str, prefix: str, count: int, cursor: str) -> tuple[list[str], str]:
+    """Highest first. The cursor is a rank, so a page may shift if scores change in between.
+
+    A prefix is applied while walking the ranking, which costs more the rarer it matches.
+    """
+    rank = int(cursor) if cursor.isdigit() else 0
+    step = max(count + 1, _RANK_SCAN) if prefix else count + 1
+    found: list[tuple[int, str]] = []
+    while len(found) <= count:
+        chunk = await r.zrevrange(queue_rank_key(sort), rank, rank + step - 1)
+        found += [(rank + i, name) for i, name in enumerate(chunk) if name.startswith(prefix)]
+        rank += step
+        if len(chunk) < step:
+            break
+    if len(found) > count:
+        return [name for _, name in found[:count]], str(found[count - 1][0] + 1)
+    return [name for _, name in found], ""
+
+
+async def _list_queues(r, prefix: str, sort: str, count: int, cursor: str) -> QueueList:
+    if sort == "name":
+        names, next_cursor = await _page_by_name(r, prefix, count, cursor)
+    else:
+        names, next_cursor = await _page_by_rank(r, sort, prefix, count, cursor)
+    configs = await queue_configs(r, names)
+    queues = []
+    for name in names:
+        queues.append(await queue_info(r, name, configs[name]))
+    total = await r.zlexcount(queue_index_key(), *_prefix_range(prefix))
+    return QueueList(queues=queues, cursor=next_cursor, has_more=bool(next_cursor), total=total)
+
+
 @router.get("", response_model=QueueList)
-async def list_queues():
+async def list_queues(
+    prefix: str = "",
+    sort: Literal["name", "depth", "failed"] = "name",
+    count: int = Query(100, ge=1, le=1000),
+    cursor: str = "",
+):
+    """List queues a page at a time, by name or by depth/failed count (highest first).
+
+    Pages come from sorted indexes of the queue names, so the cost depends on
+    ``count`` rather than on how many queues exist.
+    """
+    return await run_read(_list_queues, prefix, sort, count, cursor)
+
+
+async def index_queues():
+    """Bring the listing indexes in line with the queue set.
+
+    Run at startup: adds queues created before the indexes existed, drops
+    deleted ones and resets the failed ranking from the counters.
+    """
     r = get_redis()
-    names = await r.smembers(queue_set_key())
-    queues = []
-    for name in sorted(names):
-        queues.append(await _queue_info(r, name))
-    await r.aclose()
-    return QueueList(queues=queues)
+    try:
+        names = await r.smembers(queue_set_key())
+        pipe = r.pipeline()
+        for name in names:
+            pipe.get(stats_failed_key(name))
+        failed = await pipe.execute() if names else []
+
+        pipe = r.pipeline()
+        if names:
+            pipe.zadd(queue_index_key(), dict.fromkeys(names, 0))
+            pipe.zadd(queue_rank_key("failed"), {name: int(n or 0) for name, n in zip(names, failed)})
+            pipe.zadd(queue_rank_key("depth"), dict.fromkeys(names, 0), nx=True)
+        for key in (queue_index_key(), *map(queue_rank_key, RANKINGS)):
+            stale = set(await r.zrange(key, 0, -1)) - names
+            if stale:
+                pipe.zrem(key, *stale)
+        await pipe.execute()
+    finally:
+        await r.aclose()
 
 
 @router.post("", response_model=QueueInfo, dependencies=[Depends(verify_api_key)])
@@ -80,14 +177,18 @@ async def create_queue(body: QueueCreate):
     if await r.sismember(queue_set_key(), name):
         await r.aclose()
         raise HTTPException(status_code=409, detail=f"Queue '{name}' already exists")
+    # Its old stream may still be recreated and adopted by the purge
+    if await deletion_in_progress(r, name):
+        await r.aclose()
+        raise HTTPException(status_code=409, detail=f"Queue '{name}' is still being deleted")
 
-    # Create stream + consumer group
-    sk = stream_key(name)
+    # Create one stream + consumer group per partition
     cg = consumer_group(name)
-    try:
-        await r.xgroup_create(sk, cg, id="0", mkstream=True)
-    except Exception:
-        pass  # Group may already exist
+    for p in range(body.partitions):
+        try:
+            await r.xgroup_create(stream_key(name, p), cg, id="0", mkstream=True)
+        except Exception:
+            pass  # Group may already exist
 
     # Store metadata
     await r.hset(
@@ -97,54 +198,92 @@ async def create_queue(body: QueueCreate):
             "max_retries": str(body.max_retries),
             "claim_timeout": str(body.claim_timeout),
             "dedupe": "1" if body.dedupe else "0",
+            "partitions": str(body.partitions),
+            "partition_key": body.partition_key,
         },
     )
 
-    # Add to queue set
-    await r.sadd(queue_set_key(), name)
+    # Add to queue set and the listing indexes
+    pipe = r.pipeline()
+    pipe.sadd(queue_set_key(), name)
+    pipe.zadd(queue_index_key(), {name: 0})
+    for sort in RANKINGS:
+        pipe.zadd(queue_rank_key(sort), {name: 0})
+    await pipe.execute()
+    await publish_change(r, name)
 
-    info = await _queue_info(r, name)
+    info = await queue_info(r, name)
     await r.aclose()
     return info
 
 
 @router.get("/{name}", response_model=QueueInfo)
 async def get_queue(name: str):
+    if not await get_queue_config(name):
+        raise HTTPException(status_code=404, detail=f"Queue '{name}' not found")
+    return await run_read(queue_info, name)
+
+
+@router.patch("/{name}", response_model=QueueInfo, dependencies=[Depends(verify_api_key)])
+async def update_queue(name: str, body: QueueUpdate):
+    """Change queue settings in place. Takes effect on every replica immediately."""
     r = get_redis()
     if not await r.sismember(queue_set_key(), name):
         await r.aclose()
         raise HTTPException(status_code=404, detail=f"Queue '{name}' not found")
-    info = await _queue_info(r, name)
+
+    mapping = {}
+    if body.description is not None:
+        mapping["description"] = body.description
+    if body.max_retries is not None:
+        mapping["max_retries"] = str(body.max_retries)
+    if body.claim_timeout is not None:
+        mapping["claim_timeout"] = str(body.claim_timeout)
+    if body.dedupe is not None:
+        mapping["dedupe"] = "1" if body.dedupe else "0"
+
+    if mapping:
+        await r.hset(queue_meta_key(name), mapping=mapping)
+        await publish_change(r, name)
+
+    info = await queue_info(r, name)
     await r.aclose()
     return info
 
 
-@router.delete("/{name}", dependencies=[Depends(verify_api_key)])
+@router.delete(
+    "/{name}",
+    status_code=202,
+    response_model=QueueDeletion,
+    dependencies=[Depends(verify_api_key)],
+)
 async def delete_queue(name: str):
+    """Remove the queue now; the leader purges its jobs in the background.
+
+    Poll ``GET /queues/{name}/deletion`` for progress.
+    """
     r = get_redis()
-    if not await r.sismember(queue_set_key(), name):
+    if await deletion_in_progress(r, name):
+        await r.aclose()
+        raise HTTPException(status_code=409, detail=f"Queue '{name}' is still being deleted")
+    if not await r.srem(queue_set_key(), name):
         await r.aclose()
         raise HTTPException(status_code=404, detail=f"Queue '{name}' not found")
+    pipe = r.pipeline()
+    for key in (queue_index_key(), *map(queue_rank_key, RANKINGS)):
+        pipe.zrem(key, name)
+    await pipe.execute()
 
-    # Remove from set
-    await r.srem(queue_set_key(), name)
+    deletion = await start_deletion(r, name)
+    await r.aclose()
+    return deletion
 
-    # Delete stream, metadata, stats, dedupe set
-    await r.unlink(
-        stream_key(name),
-        queue_meta_key(name),
-        stats_completed_key(name),
-        stats_failed_key(name),
-        dedupe_key(name),
-    )
 
-    # Delete job metadata keys in batches via SCAN + UNLINK
-    cursor_val: int | str = 0
-    while True:
-        cursor_val, keys = await r.scan(cursor=cursor_val, match=f"starq:job:{name}:*", count=500)
-        if keys:
-            await r.unlink(*keys)
-        if cursor_val == 0 or cursor_val == "0":
-            break
+@router.get("/{name}/deletion", response_model=QueueDeletion)
+async def get_deletion(name: str):
+    r = get_redis()
+    status = await r.hgetall(deletion_key(name))
     await r.aclose()
-    return {"status": "deleted", "queue": name}
+    if not status:
+        raise HTTPException(status_code=404, detail=f"No deletion found for queue '{name}'")
+    return deletion_from_status(name, status)
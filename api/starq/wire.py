@@ -0,0 +1,96 @@
+"""Content negotiation for the worker-facing endpoints.
+
+Claim, submit and ack endpoints answer in one of three formats, picked from the
+``Accept`` header:
+
+- ``application/json`` (default): full ``JobInfo`` objects, as before
+- ``application/vnd.starq.compact+json``: only what a worker needs — claimed
+  jobs are ``{"id", "payload", "retries"}`` and submits return job IDs
+- ``application/msgpack``: the compact projection encoded with msgpack
+  (needs the optional ``msgpack`` package on both ends)
+
+Request bodies may be sent as JSON or msgpack according to ``Content-Type``.
+Encoding itself is in ``starq.codec``, which clients import instead of this
+module. The compact projection is a subset of the full response, so clients asking
+for it also work against servers that ignore ``Accept``.
+"""
+
+from __future__ import annotations
+
+import json
+
+from fastapi import HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from starq.codec import COMPACT_JSON, JSON, MSGPACK, decode, encode, is_msgpack, msgpack
+
+
+def negotiate(request: Request) -> str:
+    """Dependency: the media type to answer with."""
+    accept = request.headers.get("accept", "")
+    if is_msgpack(accept):
+        if msgpack is None:
+            raise HTTPException(status_code=406, detail="msgpack is not available on this server")
+        return MSGPACK
+    if COMPACT_JSON in accept:
+        return COMPACT_JSON
+    return JSON
+
+
+def compact(media_type: str) -> bool:
+    return media_type != JSON
+
+
+def reply(data, media_type: str):
+    """Return ``data`` for FastAPI to serialize as usual, or encoded in a compact format."""
+    if media_type == JSON:
+        return data
+    return Response(content=encode(data, media_type), media_type=media_type)
+
+
+def claimed(jobs: list[tuple[str, str, str, int]], media_type: str, with_queue: bool = False) -> Response:
+    """Compact claim response from ``(queue, job ID, payload JSON, retries)`` tuples.
+
+    Payloads are stored as JSON, so the JSON format splices them in as-is
+    instead of decoding and re-encoding each one. The queue is only included
+    for claims that span several queues.
+    """
+    if is_msgpack(media_type):
+        items = []
+        for q, i, p, n in jobs:
+            item = {"id": i, "payload": json.loads(p), "retries": n}
+            if with_queue:
+                item["queue"] = q
+            items.append(item)
+        return Response(content=msgpack.packb({"jobs": items}), media_type=media_type)
+    items = []
+    for q, i, p, n in jobs:
+        queue = f',"queue":{json.dumps(q)}' if with_queue else ""
+        items.append(f'{{"id":{json.dumps(i)},"payload":{p},"retries":{n}{queue}}}')
+    return Response(content=f'{{"jobs":[{",".join(items)}]}}'.encode(), media_type=media_type)
+
+
+def body(model):
+    """Dependency factory: the request body decoded per ``Content-Type`` and validated as ``model``."""
+    adapter = TypeAdapter(model)
+
+    async def dependency(request: Request):
+        content_type = request.headers.get("content-type", JSON)
+        if is_msgpack(content_type) and msgpack is None:
+            raise HTTPException(status_code=415, detail="msgpack is not available on this server")
+        raw = await request.body()
+        if not raw:  # What FastAPI answers for a missing required body
+            raise RequestValidationError([{"type": "missing", "loc": ("body",), "msg": "Field required", "input": None}])
+        try:
+            data = decode(raw, content_type)
+        except ValueError as e:  # JSONDecodeError and msgpack's errors are ValueErrors
+            raise HTTPException(status_code=400, detail=f"Malformed request body: {e}")
+        try:
+            return adapter.validate_python(data)
+        except ValidationError as e:
+            raise RequestValidationError(
+                [{**err, "loc": ("body", *err["loc"])} for err in e.errors(include_url=False)]
+            )
+
+    return dependency
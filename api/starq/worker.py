@@ -0,0 +1,297 @@
+"""Async worker runtime for Starq queues.
+
+    from starq.worker import run
+
+    async def handle(job):
+        return {"length": len(job["payload"]["text"])}
+
+    run(handle, "my-queue", url="https://queue.example.com", api_key="...")
+
+One fetcher long-polls ``claim`` (``POST /claim`` across all of them when given
+several queues) and keeps a prefetch buffer topped up,
+``concurrency`` runners take jobs from it, and results are acknowledged in
+batches through ``POST /jobs/complete``. While a job sits in the buffer or
+runs, its lease is renewed with ``POST /jobs/heartbeat`` so slow handlers are
+not reclaimed by other workers; a lease lost anyway (the job was reclaimed)
+is logged and no longer renewed. On SIGINT/SIGTERM the worker stops
+claiming, finishes what it holds and flushes outstanding acks.
+
+Handlers receive the claimed job (``id``, ``payload`` and ``retries``, or the
+full ``JobInfo`` with ``wire="json"``) and return a result dict (or None).
+Raising fails the job with the exception text. Coroutine functions run on the
+event loop, plain functions in a thread, or in a process pool with
+``processes=True`` (the handler must then be picklable, i.e. defined at module
+level).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+import os
+import signal
+import socket
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from starq import codec
+
+logger = logging.getLogger("starq")
+
+
+class Worker:
+    def __init__(
+        self,
+        handler,
+        queue: str | list[str],
+        *,
+        url: str = "http://localhost:8000",
+        api_key: str | None = None,
+        concurrency: int = 4,
+        prefetch: int | None = None,  # jobs held ahead of the runners (default: concurrency)
+        processes: bool = False,
+        block_ms: int = 5000,
+        heartbeat_interval: float | None = None,  # default: a third of the shortest claim_timeout
+        weights: dict[str, float] | None = None,  # with several queues: pick in proportion instead of list order
+        ack_batch: int = 50,
+        ack_interval: float = 0.5,
+        wire: str = "compact",  # json | compact | msgpack, see starq.wire
+        name: str | None = None,  # lease owner sent with claims and heartbeats (default: host, pid and a random suffix)
+    ):
+        self.handler = handler
+        self.queues = [queue] if isinstance(queue, str) else list(queue)
+        self.weights = weights or {}
+        self.concurrency = concurrency
+        self.prefetch = prefetch if prefetch is not None else concurrency
+        self.processes = processes
+        self.block_ms = block_ms
+        self.heartbeat_interval = heartbeat_interval
+        self.ack_batch = ack_batch
+        self.ack_interval = ack_interval
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        if wire == "msgpack" and codec.msgpack is None:
+            raise ImportError("wire='msgpack' needs the msgpack package: install starq[msgpack]")
+        self.media_type = codec.FORMATS[wire]
+        self.body_type = codec.MSGPACK if wire == "msgpack" else codec.JSON
+
+        headers = {"X-API-Key": api_key} if api_key else {}
+        self.client = httpx.AsyncClient(
+            base_url=f"{url}/api/v1",
+            headers=headers,
+            timeout=httpx.Timeout(10, read=block_ms / 1000 + 10),
+            limits=httpx.Limits(max_keepalive_connections=concurrency + 2),
+        )
+        self._buffer: asyncio.Queue[dict] = asyncio.Queue()
+        self._space = asyncio.Semaphore(self.prefetch)  # one permit per free buffer slot
+        self._held: dict[str, str] = {}  # job ID -> queue, for jobs claimed and not yet acknowledged
+        self._acks: dict[str, list[dict]] = {}  # queue -> completions waiting to be sent
+        self._ack_ready = asyncio.Event()
+        self._closing = False
+        self._stopping = asyncio.Event()
+        self._pool: ProcessPoolExecutor | None = None
+
+    def stop(self):
+        """Stop claiming; jobs already held are finished and acknowledged."""
+        self._stopping.set()
+
+    async def run(self):
+        if self.heartbeat_interval is None:
+            timeouts = []
+            try:
+                for queue in self.queues:
+                    resp = await self.client.get(f"/queues/{queue}")
+                    resp.raise_for_status()
+                    timeouts.append(resp.json()["claim_timeout"])
+            except httpx.HTTPError:
+                await self.client.aclose()
+                raise
+            self.heartbeat_interval = max(1.0, min(timeouts) / 3)
+
+        loop = asyncio.get_running_loop()
+        signals = []
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+                signals.append(sig)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not the main thread, or not supported on this platform
+        if self.processes:
+            self._pool = ProcessPoolExecutor(max_workers=self.concurrency)
+
+        logger.info(f"Worker on {', '.join(self.queues)}: concurrency={self.concurrency} prefetch={self.prefetch}")
+        fetcher = asyncio.create_task(self._fetch())
+        heartbeat = asyncio.create_task(self._heartbeat())
+        acker = asyncio.create_task(self._ack_loop())
+        runners = [asyncio.create_task(self._run_jobs()) for _ in range(self.concurrency)]
+        try:
+            await fetcher
+            await self._buffer.join()
+        finally:
+            for task in runners + [heartbeat]:
+                task.cancel()
+            await asyncio.gather(*runners, heartbeat, return_exceptions=True)
+            # Let the acker finish its current batch and flush the rest
+            self._closing = True
+            self._ack_ready.set()
+            await acker
+            if self._pool is not None:
+                self._pool.shutdown()
+            await self.client.aclose()
+            for sig in signals:
+                loop.remove_signal_handler(sig)
+            logger.info(f"Worker on {', '.join(self.queues)} stopped")
+
+    async def _fetch(self):
+        while True:
+            # Wait for at least one free slot, then claim as many as are free
+            if not await self._acquire_space():
+                return
+            count = 1
+            while not self._space.locked():
+                await self._space.acquire()
+                count += 1
+            try:
+                jobs = await self._claim(count)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Claim failed: {e}")
+                jobs = []
+                await self._wait_stopping(1)
+            for _ in range(count - len(jobs)):
+                self._space.release()
+            for job in jobs:
+                job.setdefault("queue", self.queues[0])  # single-queue compact claims omit it
+                self._held[job["id"]] = job["queue"]
+                self._buffer.put_nowait(job)
+            # Jobs beyond `count` still take a slot each: wait for the runners to
+            # free them before claiming again, so the buffer stays within prefetch
+            for _ in range(len(jobs) - count):
+                await self._space.acquire()
+
+    async def _acquire_space(self) -> bool:
+        """Wait for a free buffer slot. Returns False once the worker is stopping."""
+        if self._stopping.is_set():
+            return False
+        acquire = asyncio.create_task(self._space.acquire())
+        stopping = asyncio.create_task(self._stopping.wait())
+        await asyncio.wait({acquire, stopping}, return_when=asyncio.FIRST_COMPLETED)
+        acquire.cancel()
+        stopping.cancel()
+        return not self._stopping.is_set()
+
+    async def _claim(self, count: int) -> list[dict]:
+        # Not interrupted on stop: a claim abandoned mid-poll could still take
+        # jobs on the server, leaving them held by nobody until they time out.
+        data = {"count": count, "block_ms": self.block_ms, "worker": self.name}
+        if len(self.queues) == 1:
+            body = await self._send("POST", f"/queues/{self.queues[0]}/jobs/claim", data)
+        else:
+            body = await self._send("POST", "/claim", {"queues": self.queues, "weights": self.weights, **data})
+        return body["jobs"]
+
+    async def _send(self, method: str, path: str, data: dict) -> dict:
+        resp = await self.client.request(
+            method,
+            path,
+            content=codec.encode(data, self.body_type),
+            headers={"Content-Type": self.body_type, "Accept": self.media_type},
+        )
+        resp.raise_for_status()
+        return codec.decode(resp.content, resp.headers.get("content-type", codec.JSON))
+
+    async def _run_jobs(self):
+        while True:
+            job = await self._buffer.get()
+            self._space.release()
+            try:
+                result = await self._call(job)
+            except Exception as e:
+                await self._fail(job, e)
+            else:
+                acks = self._acks.setdefault(job["queue"], [])
+                acks.append({"id": job["id"], "result": result or {}})
+                if len(acks) >= self.ack_batch:
+                    self._ack_ready.set()
+            finally:
+                self._buffer.task_done()
+
+    async def _call(self, job: dict):
+        if inspect.iscoroutinefunction(self.handler):
+            return await self.handler(job)
+        if self._pool is not None:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, self.handler, job)
+        return await asyncio.to_thread(self.handler, job)
+
+    async def _fail(self, job: dict, error: Exception):
+        logger.warning(f"Job {job['id']} failed: {error}")
+        try:
+            await self._send("PUT", f"/queues/{job['queue']}/jobs/{job['id']}/fail", {"error": str(error)})
+        except httpx.HTTPError as e:
+            logger.error(f"Could not report failure of job {job['id']}: {e}")
+        self._held.pop(job["id"], None)
+
+    async def _ack_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._ack_ready.wait(), self.ack_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._ack_ready.clear()
+            await self._flush_acks()
+            if self._closing:
+                unsent = sum(len(acks) for acks in self._acks.values())
+                if unsent:
+                    logger.error(f"Exiting with {unsent} unacknowledged jobs; they will be retried")
+                return
+
+    async def _flush_acks(self):
+        for queue in list(self._acks):
+            acks = self._acks[queue]
+            while acks:
+                batch = acks[: self.ack_batch]
+                try:
+                    body = await self._send("POST", f"/queues/{queue}/jobs/complete", {"jobs": batch})
+                except httpx.HTTPError as e:
+                    # Keep the leases alive and try again on the next flush
+                    logger.error(f"Could not acknowledge {len(batch)} jobs: {e}")
+                    break
+                del acks[: len(batch)]
+                missing = body.get("missing", [])
+                if missing:
+                    logger.warning(f"{len(missing)} completed jobs were no longer known to the server")
+                for item in batch:
+                    self._held.pop(item["id"], None)
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            by_queue: dict[str, list[str]] = {}
+            for job_id, queue in self._held.items():
+                by_queue.setdefault(queue, []).append(job_id)
+            for queue, ids in by_queue.items():
+                try:
+                    body = await self._send("POST", f"/queues/{queue}/jobs/heartbeat", {"ids": ids, "worker": self.name})
+                except httpx.HTTPError as e:
+                    logger.error(f"Heartbeat failed: {e}")
+                    continue
+                lost = (set(ids) - set(body["jobs"])) & self._held.keys()
+                if lost:
+                    # Stop renewing them; results are still acknowledged when they finish
+                    logger.warning(f"Lost the lease on {len(lost)} jobs in '{queue}'")
+                    for job_id in lost:
+                        self._held.pop(job_id, None)
+
+    async def _wait_stopping(self, seconds: float):
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            pass
+
+
+def run(handler, queue: str | list[str], **options):
+    """Run a worker until SIGINT/SIGTERM. ``options`` are passed to ``Worker``."""
+    asyncio.run(Worker(handler, queue, **options).run())
@@ -0,0 +1,32 @@
+"""The API in process over httpx's ASGI transport, on a fresh in-memory fakeredis per test."""
+
+from __future__ import annotations
+
+import fakeredis
+import httpx
+import pytest
+import redis.asyncio as redis
+from fakeredis.aioredis import FakeConnection
+
+from starq import queue_config, redis_client
+from starq.config import settings
+from starq.main import app
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    settings.redis_cluster = False
+    redis_client.pool = redis.ConnectionPool(
+        connection_class=FakeConnection, server=fakeredis.FakeServer(), decode_responses=True
+    )
+    queue_config.invalidate()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as c:
+            yield c
+    finally:
+        await redis_client.close_pool()
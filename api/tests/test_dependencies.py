@@ -0,0 +1,130 @@
+"""Job dependencies end to end: release, cascading failure and the submit/complete race."""
+
+from __future__ import annotations
+
+import asyncio
+import random
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+RACE_STEPS = 40  # event loop turns a parent's completion is delayed by, at most
+
+
+@pytest.fixture
+async def queue(client) -> str:
+    # max_retries=0 makes every fail final
+    resp = await client.post("/api/v1/queues", json={"name": "deps", "max_retries": 0})
+    resp.raise_for_status()
+    return "deps"
+
+
+async def submit(client, queue: str, *depends_on: str) -> str:
+    job = {"payload": {}, "depends_on": list(depends_on)} if depends_on else {"payload": {}}
+    resp = await client.post(f"/api/v1/queues/{queue}/jobs", json={"jobs": [job]})
+    resp.raise_for_status()
+    return resp.json()["jobs"][0]["id"]
+
+
+async def claim_all(client, queue: str) -> list[str]:
+    claimed: list[str] = []
+    while True:
+        resp = await client.post(f"/api/v1/queues/{queue}/jobs/claim", json={"count": 100})
+        resp.raise_for_status()
+        ids = [job["id"] for job in resp.json()["jobs"]]
+        if not ids:
+            return claimed
+        claimed += ids
+
+
+async def finish(client, queue: str, job_id: str, outcome: str = "complete"):
+    body = {"error": "test"} if outcome == "fail" else {"result": {}}
+    resp = await client.put(f"/api/v1/queues/{queue}/jobs/{job_id}/{outcome}", json=body)
+    resp.raise_for_status()
+
+
+async def statuses(client, queue: str, status: str) -> set[str]:
+    ids: set[str] = set()
+    params = {"status": status, "count": 500}
+    while True:
+        resp = await client.get(f"/api/v1/queues/{queue}/jobs", params=params)
+        resp.raise_for_status()
+        body = resp.json()
+        ids.update(job["id"] for job in body["jobs"])
+        if not body["has_more"]:
+            return ids
+        params["cursor"] = body["cursor"]
+
+
+async def test_released_by_last_parent_only(client, queue):
+    a, b = await submit(client, queue), await submit(client, queue)
+    assert set(await claim_all(client, queue)) == {a, b}
+    c = await submit(client, queue, a, b)
+    assert await statuses(client, queue, "waiting") == {c}
+
+    await finish(client, queue, a)
+    assert await statuses(client, queue, "waiting") == {c}
+    assert await claim_all(client, queue) == []
+
+    await finish(client, queue, b)
+    assert not await statuses(client, queue, "waiting")
+    assert await claim_all(client, queue) == [c]
+
+
+async def test_failure_cascades(client, queue):
+    a, x = await submit(client, queue), await submit(client, queue)
+    await claim_all(client, queue)
+    y = await submit(client, queue, x)
+    z = await submit(client, queue, y, a)
+
+    await finish(client, queue, x, "fail")
+    assert not await statuses(client, queue, "waiting")
+    assert {x, y, z} <= await statuses(client, queue, "failed")
+
+    # A's completion has nothing left to release
+    await finish(client, queue, a)
+    assert await claim_all(client, queue) == []
+
+
+async def test_finished_parents_count_at_submit(client, queue):
+    c, x = await submit(client, queue), await submit(client, queue)
+    await claim_all(client, queue)
+    await finish(client, queue, c)
+    await finish(client, queue, x, "fail")
+
+    done = await submit(client, queue, c)
+    failed = await submit(client, queue, x, c)
+    assert await claim_all(client, queue) == [done]
+    assert failed in await statuses(client, queue, "failed")
+
+
+async def test_missing_parent(client, queue):
+    resp = await client.post(f"/api/v1/queues/{queue}/jobs", json={"payload": {}, "depends_on": ["1-0"]})
+    assert resp.status_code == 404
+
+
+async def test_parent_completing_during_submit_releases_once(client, queue):
+    # Every child waits on two parents; the first is done and the second
+    # completes while the child is being submitted
+    rng = random.Random(0)
+    parents = [await submit(client, queue) for _ in range(100)]
+    await claim_all(client, queue)
+    pairs = list(zip(parents[::2], parents[1::2]))
+    for first, _ in pairs:
+        await finish(client, queue, first)
+
+    async def complete_later(job_id: str, steps: int):
+        for _ in range(steps):
+            await asyncio.sleep(0)  # Land somewhere inside the submit
+        await finish(client, queue, job_id)
+
+    async def race(first: str, second: str) -> str:
+        child, _ = await asyncio.gather(
+            submit(client, queue, first, second), complete_later(second, rng.randrange(RACE_STEPS))
+        )
+        return child
+
+    children = await asyncio.gather(*(race(first, second) for first, second in pairs))
+    assert sorted(await claim_all(client, queue)) == sorted(children)
+    assert not await statuses(client, queue, "waiting")
@@ -1,17 +1,26 @@
 "use client";
 
-import { useCallback } from "react";
+import { useCallback, useState } from "react";
 import { motion } from "framer-motion";
 import { QueueCard } from "@/components/queue-card";
 import { CreateQueueDialog } from "@/components/create-queue-dialog";
-import { listQueues } from "@/lib/api";
+import { Input } from "@/components/ui/input";
+import { listQueuePages } from "@/lib/api";
 import { usePolling } from "@/lib/use-polling";
-import type { QueueList } from "@/lib/types";
+import type { QueueList, QueueSort } from "@/lib/types";
+
+const sorts: QueueSort[] = ["name", "depth", "failed"];
 
 export default function QueuesPage() {
-  const fetcher = useCallback(() => listQueues(), []);
+  const [prefix, setPrefix] = useState("");
+  const [sort, setSort] = useState<QueueSort>("name");
+  const [pages, setPages] = useState(1);
+
+  // Polling refreshes every page loaded so far
+  const fetcher = useCallback(() => listQueuePages(prefix, sort, pages), [prefix, sort, pages]);
   const { data, refresh, loading } = usePolling<QueueList>(fetcher, 5000);
   const queues = data?.queues || [];
+  const total = data?.total ?? queues.length;
 
   return (
     <div className="space-y-6">
@@ -19,12 +28,42 @@ export default function QueuesPage() {
         <motion.div initial={{ opacity: 0 }} animate={{ opacity: 1 }}>
           <h1 className="text-lg font-semibold text-foreground">Queues</h1>
           <p className="text-xs text-muted-foreground/60 mt-0.5">
-            {queues.length} queue{queues.length !== 1 ? "s" : ""} registered
+            {total} queue{total !== 1 ? "s" : ""} {prefix ? "matching" : "registered"}
           </p>
         </motion.div>
         <CreateQueueDialog onCreated={refresh} />
       </div>
 
+      <div className="flex items-center gap-3">
+        <Input
+          value={prefix}
+          onChange={(e) => {
+            setPrefix(e.target.value);
+            setPages(1);
+          }}
+          placeholder="Filter by prefix"
+          className="text-xs h-8 max-w-xs"
+        />
+        <div className="flex items-center gap-1">
+          {sorts.map((s) => (
+            <button
+              key={s}
+              onClick={() => {
+                setSort(s);
+                setPages(1);
+              }}
+              className={`px-2.5 py-1 rounded text-[11px] font-medium transition-colors ${
+                sort === s
+                  ? "text-foreground bg-white/[0.06]"
+                  : "text-muted-foreground/50 hover:text-foreground/70"
+              }`}
+            >
+              {s}
+            </button>
+          ))}
+        </div>
+      </div>
+
       {!loading && queues.length === 0 ? (
         <motion.div
           initial={{ opacity: 0 }}
@@ -34,7 +73,9 @@ export default function QueuesPage() {
           <svg viewBox="0 0 24 24" fill="none" className="size-8 text-muted-foreground/20 mb-3">
             <path d="M12 2L14.5 8.5L21 12L14.5 15.5L12 22L9.5 15.5L3 12L9.5 8.5L12 2Z" stroke="currentColor" strokeWidth="1" />
           </svg>
-          <p className="text-xs text-muted-foreground/40">No queues created yet</p>
+          <p className="text-xs text-muted-foreground/40">
+            {prefix ? "No queues match this prefix" : "No queues created yet"}
+          </p>
         </motion.div>
       ) : (
         <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-3">
@@ -43,13 +84,24 @@ export default function QueuesPage() {
               key={q.name}
               initial={{ opacity: 0, y: 6 }}
               animate={{ opacity: 1, y: 0 }}
-              transition={{ delay: i * 0.04, duration: 0.3 }}
+              transition={{ delay: Math.min(i, 12) * 0.04, duration: 0.3 }}
             >
               <QueueCard queue={q} />
             </motion.div>
           ))}
         </div>
       )}
+
+      {data?.has_more && (
+        <div className="flex justify-center">
+          <button
+            onClick={() => setPages((p) => p + 1)}
+            className="px-3 py-1.5 rounded text-[11px] font-medium text-muted-foreground/60 hover:text-foreground/80 bg-white/[0.03] hover:bg-white/[0.06] transition-colors"
+          >
+            Load more ({queues.length} of {total})
+          </button>
+        </div>
+      )}
     </div>
   );
 }
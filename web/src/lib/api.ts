@@ -1,6 +1,7 @@
 import type {
   QueueList,
   QueueInfo,
+  QueueSort,
   QueueCreate,
   JobListResponse,
   JobSubmit,
@@ -47,8 +48,34 @@ async function request<T>(
 
 // --- Queues ---
 
-export async function listQueues(): Promise<QueueList> {
-  return request<QueueList>(`${API_BASE}/queues`);
+export async function listQueues(
+  prefix = "",
+  sort: QueueSort = "name",
+  count = 100,
+  cursor?: string
+): Promise<QueueList> {
+  const params = new URLSearchParams();
+  if (prefix) params.set("prefix", prefix);
+  params.set("sort", sort);
+  params.set("count", String(count));
+  if (cursor) params.set("cursor", cursor);
+  return request<QueueList>(`${API_BASE}/queues?${params}`);
+}
+
+// Walk the cursor for the first `pages` pages
+export async function listQueuePages(
+  prefix: string,
+  sort: QueueSort,
+  pages: number,
+  count = 100
+): Promise<QueueList> {
+  let res = await listQueues(prefix, sort, count);
+  const queues = [...res.queues];
+  for (let page = 1; page < pages && res.has_more; page++) {
+    res = await listQueues(prefix, sort, count, res.cursor);
+    queues.push(...res.queues);
+  }
+  return { ...res, queues };
 }
 
 export async function getQueue(name: string): Promise<QueueInfo> {
@@ -4,20 +4,28 @@ export interface QueueInfo {
   max_retries: number;
   claim_timeout: number;
   dedupe: boolean;
+  partitions: number;
+  partition_key: string;
   pending: number;
   claimed: number;
+  waiting: number;
   completed: number;
   failed: number;
 }
 
 export interface QueueList {
   queues: QueueInfo[];
+  cursor: string;
+  has_more: boolean;
+  total: number;
 }
 
+export type QueueSort = "name" | "depth" | "failed";
+
 export interface JobInfo {
   id: string;
   queue: string;
-  status: "pending" | "claimed" | "completed" | "failed";
+  status: "waiting" | "pending" | "claimed" | "completed" | "failed" | "expired";
   payload: Record<string, unknown>;
   result: Record<string, unknown>;
   error: string;
@@ -43,6 +51,8 @@ export interface QueueCreate {
   max_retries?: number;
   claim_timeout?: number;
   dedupe?: boolean;
+  partitions?: number;
+  partition_key?: string;
 }
 
 export interface JobSubmit {